@@ -0,0 +1,166 @@
+import numpy as np
+from constants import *
+from placements import get_placement_table
+from game_state import game_state
+
+NUM_CELLS = (BOARD_HEIGHT+2)*(BOARD_WIDTH+2)
+
+#plays random games on K boards at once, every game moving in the same step
+#board, adj_board and diag_board are KxHxW stacks of the arrays Board keeps (one bit per player in each cell),
+#stored as views of K x (NUM_CELLS+1) flat arrays whose last column is a dummy cell that's always empty,
+#so that the PlacementTable cell index arrays can be used to gather and scatter whole footprints at once
+#random plays are picked like Board.one_possible_play: each game tries its corners in a random order and takes
+#a random legal placement at the first corner where anything fits (uniform over placements rather than pieces first)
+class BatchPlayout:
+    #games is a list of Games or GameStates to play out, which are not changed
+    def __init__(self, games):
+        self.pieces = games[0].pieces
+        self.table = get_placement_table(self.pieces)
+        self.piece_values = np.array([piece.value for piece in self.pieces], dtype=np.int64)
+        num_games = len(games)
+        states = [game_state(game) for game in games]
+
+        self.cells = np.zeros((num_games, NUM_CELLS+1), dtype=np.uint8)
+        self.adj_cells = np.zeros((num_games, NUM_CELLS+1), dtype=np.uint8)
+        self.diag_cells = np.zeros((num_games, NUM_CELLS+1), dtype=np.uint8)
+        shape = (num_games, BOARD_HEIGHT+2, BOARD_WIDTH+2)
+        self.board = self.cells[:, :NUM_CELLS].reshape(shape)
+        self.adj_board = self.adj_cells[:, :NUM_CELLS].reshape(shape)
+        self.diag_board = self.diag_cells[:, :NUM_CELLS].reshape(shape)
+        for k in range(num_games):
+            self.board[k] = states[k].board.board
+        self.init_adj_diag()
+
+        self.piece_ids_left = np.array([state.piece_ids_left for state in states], dtype=bool)
+        self.scores = np.array([state.scores for state in states], dtype=np.int64)
+        self.finished = np.array([state.finished for state in states], dtype=bool)
+        self.turn = np.array([state.turn for state in states], dtype=np.int64)
+        #turns in which each game's players looked for a play (like the num_plays stat, this includes finding nothing)
+        self.num_plays = np.zeros(num_games, dtype=np.int64)
+
+    #works out adj_board and diag_board for every player from the board
+    #a cell is in diag_board if it's diagonal to one of the player's squares (or the padded corners) but not next to one
+    def init_adj_diag(self):
+        for player_id in range(NUM_PLAYERS):
+            own = (self.board & np.uint8(1 << player_id)) != 0
+            adj = np.zeros(own.shape, dtype=bool)
+            adj[:, 1:, :] |= own[:, :-1, :]
+            adj[:, :-1, :] |= own[:, 1:, :]
+            adj[:, :, 1:] |= own[:, :, :-1]
+            adj[:, :, :-1] |= own[:, :, 1:]
+            diag = np.zeros(own.shape, dtype=bool)
+            diag[:, 1:, 1:] |= own[:, :-1, :-1]
+            diag[:, 1:, :-1] |= own[:, :-1, 1:]
+            diag[:, :-1, 1:] |= own[:, 1:, :-1]
+            diag[:, :-1, :-1] |= own[:, 1:, 1:]
+            self.adj_board |= np.uint8(1 << player_id)*adj
+            self.diag_board |= np.uint8(1 << player_id)*(diag & ~adj)
+
+    #finds the corner slots (see PlacementTable.corner_counts) of the player to move in each of the games with the given indices
+    #returns (game positions in games, slots), grouped by game with each game's slots in a random order
+    def corner_slots(self, games, player_bits):
+        board = self.board[games]
+        bits = player_bits[:, None, None]
+        own = (board & bits) != 0
+        free = (board == 0) & ((self.adj_board[games] & bits) == 0) & ((self.diag_board[games] & bits) != 0)
+        #corner type i has the player's square at the same diagonal as Board.corners
+        corners = np.zeros((len(games), 4) + own.shape[1:], dtype=bool)
+        corners[:, 0, :-1, 1:] = own[:, 1:, :-1]
+        corners[:, 1, :-1, :-1] = own[:, 1:, 1:]
+        corners[:, 2, 1:, :-1] = own[:, :-1, 1:]
+        corners[:, 3, 1:, 1:] = own[:, :-1, :-1]
+        corners &= free[:, None, :, :]
+        positions, slots = np.nonzero(corners.reshape((len(games), 4*NUM_CELLS)))
+        keep = self.table.corner_counts[slots] > 0
+        positions = positions[keep]
+        slots = slots[keep]
+        order = np.lexsort((np.random.random(len(slots)), positions))
+        return positions[order], slots[order]
+
+    #picks a random play for the player to move in each of the games with the given indices
+    #returns an array of placement indices, with -1 for games where the player can't play anything
+    def random_plays(self, games):
+        player_ids = self.turn[games]
+        player_bits = (np.uint8(1) << player_ids.astype(np.uint8))
+        positions, slots = self.corner_slots(games, player_bits)
+        #each game's rank among its own slots, so that round r can check every game's r-th corner together
+        group_starts = np.searchsorted(positions, np.arange(len(games)))
+        ranks = np.arange(len(positions)) - group_starts[positions]
+        blocked = (self.cells[games] != 0) | ((self.adj_cells[games] & player_bits[:, None]) != 0)
+        live = self.piece_ids_left[games, player_ids]
+
+        table = self.table
+        plays = -np.ones(len(games), dtype=np.int64)
+        pending = np.ones(len(games), dtype=bool)
+        for rank in range(int(np.max(ranks))+1 if len(ranks) > 0 else 0):
+            current = (ranks == rank) & pending[positions]
+            if not np.any(current):
+                break
+            curr_positions = positions[current]
+            curr_slots = slots[current]
+            #every placement of a piece that's left at each game's current corner, as (game position, placement) pairs
+            counts = table.corner_counts[curr_slots]
+            cand_positions = np.repeat(curr_positions, counts)
+            offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+            cand_indices = table.corner_indices[np.repeat(table.corner_starts[curr_slots], counts) + offsets]
+            keep = live[cand_positions, table.placement_pids[cand_indices]]
+            keep[keep] = ~np.any(blocked[cand_positions[keep, None], table.area_cells[cand_indices[keep]]], axis=1)
+            cand_positions = cand_positions[keep]
+            cand_indices = cand_indices[keep]
+            #one random legal placement for each game that has any
+            num_legal = np.bincount(cand_positions, minlength=len(games))
+            found = np.flatnonzero(num_legal)
+            starts = np.cumsum(num_legal) - num_legal
+            picks = starts[found] + (np.random.random(len(found))*num_legal[found]).astype(np.int64)
+            plays[found] = cand_indices[picks]
+            pending[found] = False
+        return plays
+
+    #places placement index plays[i] for player player_ids[i] in game games[i]
+    def execute_plays(self, games, player_ids, plays):
+        table = self.table
+        rows = games[:, None]
+        player_bits = (np.uint8(1) << player_ids.astype(np.uint8))[:, None]
+        self.cells[rows, table.area_cells[plays]] |= player_bits
+        self.adj_cells[rows, table.adj_cells[plays]] |= player_bits
+        self.diag_cells[rows, table.diag_cells[plays]] |= player_bits
+        self.cells[:, NUM_CELLS] = 0
+        self.adj_cells[:, NUM_CELLS] = 0
+        self.diag_cells[:, NUM_CELLS] = 0
+        pids = table.placement_pids[plays]
+        self.piece_ids_left[games, player_ids, pids] = False
+        self.scores[games, player_ids] -= self.piece_values[pids]
+
+    #plays one turn in every game that isn't over yet
+    #returns the number of games that are still going
+    def step(self):
+        active = np.flatnonzero(~np.all(self.finished, axis=1))
+        if len(active) == 0:
+            return 0
+        moving = active[~self.finished[active, self.turn[active]]]
+        if len(moving) > 0:
+            plays = self.random_plays(moving)
+            self.num_plays[moving] += 1
+            played = plays >= 0
+            self.finished[moving[~played], self.turn[moving[~played]]] = True
+            if np.any(played):
+                self.execute_plays(moving[played], self.turn[moving[played]], plays[played])
+        self.turn[active] = (self.turn[active]+1) % NUM_PLAYERS
+        return int(np.count_nonzero(~np.all(self.finished, axis=1)))
+
+    #returns a list of the player IDs of the players currently in the lead in every game
+    def get_leaders(self):
+        leaders = self.scores == np.min(self.scores, axis=1)[:, None]
+        return [np.flatnonzero(row).tolist() for row in leaders]
+
+    #plays every game to the end and returns the list of winners of each one (see get_leaders)
+    def run(self):
+        while self.step() > 0:
+            pass
+        return self.get_leaders()
+
+
+#plays each of games (Games or GameStates, which can repeat) out once, all in one batch
+#returns a list of the winners of each game, like random_playout does for one game
+def batch_playouts(games):
+    return BatchPlayout(games).run()
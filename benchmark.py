@@ -0,0 +1,122 @@
+"""
+Running this file times the move generators on a set of mid-game positions.
+Positions come from seeded random self-play, so every run (and every engine) sees the same boards.
+"""
+
+import random
+import time
+import numpy as np
+import board as board_module
+from constants import *
+from board import Board
+from bitboard import BitBoard
+from player import Player
+from game import Game
+from piece import read_pieces
+from placements import get_placement_table
+from search import test_endgame
+
+
+#plays seeded random games and keeps a snapshot every few turns once the game is under way
+#returns a list of (board, player_pieces, turn) tuples that can be handed to the Game constructor
+def random_positions(pieces, num_games, seed=0, first_turn=12, every=8):
+    random.seed(seed)
+    positions = []
+    for _ in range(num_games):
+        game = Game(pieces, [Player(i) for i in range(NUM_PLAYERS)])
+        turn_num = 0
+        while not game.is_finished():
+            if turn_num >= first_turn and turn_num % every == 0:
+                positions.append((np.copy(game.board.board), [np.copy(p.pieces) for p in game.players], game.turn))
+            if game.players[game.turn].finished:
+                game.pass_turn()
+            else:
+                play = game.one_possible_play()
+                if play is None:
+                    game.players[game.turn].finished = True
+                    game.pass_turn()
+                else:
+                    game.execute_play(game.turn, play[0], play[1], play[2], play[3])
+            turn_num += 1
+    return positions
+
+
+#times board.possible_plays for every position and every player on a board built by board_class
+#returns (seconds, number of plays found, list of play sets)
+def time_possible_plays(pieces, positions, board_class, repeats=3):
+    boards = [board_class(board) for board, _, _ in positions]
+    found = []
+    start_time = time.time()
+    for _ in range(repeats):
+        found = []
+        for i in range(len(positions)):
+            for player_id in range(NUM_PLAYERS):
+                found.append(set(boards[i].possible_plays(player_id, positions[i][1][player_id], pieces)))
+    elapsed = time.time() - start_time
+    return elapsed, repeats*sum([len(plays) for plays in found]), found
+
+
+def bench_board_engines(pieces, positions):
+    print('Move generation over ' + str(len(positions)) + ' positions x ' + str(NUM_PLAYERS) + ' players')
+    results = {}
+    for name, board_class in (('numpy', Board), ('bitboard', BitBoard)):
+        elapsed, num_plays, found = time_possible_plays(pieces, positions, board_class)
+        results[name] = found
+        print('  ' + name + ': ' + str(int(num_plays/elapsed)) + ' moves/s (' + str(round(elapsed, 2)) + ' s)')
+    if results['numpy'] != results['bitboard']:
+        print('ERROR: board engines disagree on the possible plays')
+
+
+#compares generating plays from the precomputed placement tables against looping over piece shapes
+def bench_placement_tables(pieces, positions):
+    print('Placement tables vs. per-corner shape loops')
+    for name, board_class in (('numpy', Board), ('bitboard', BitBoard)):
+        for use_tables in (False, True):
+            board_module.PLACEMENT_TABLES = use_tables
+            elapsed, num_plays, _ = time_possible_plays(pieces, positions, board_class)
+            label = name + (' (tables)' if use_tables else ' (shape loops)')
+            print('  ' + label + ': ' + str(int(num_plays/elapsed)) + ' moves/s (' + str(round(elapsed, 2)) + ' s)')
+    board_module.PLACEMENT_TABLES = PLACEMENT_TABLES
+
+
+#times checking every candidate play at every corner one at a time with legal_play vs. in one legal_plays_batch call
+def bench_batch_legality(pieces, positions):
+    table = get_placement_table(pieces)
+    test_game = test_endgame(pieces, [Player(i) for i in range(NUM_PLAYERS)])
+    positions = positions + [(test_game.board.board, [player.pieces for player in test_game.players], test_game.turn)]
+    candidates = []
+    for board, player_pieces, turn in positions:
+        corners = Board(board).corners(turn)
+        plays = set()
+        for i in range(4):
+            rows, cols = corners[i]
+            for j in range(len(rows)):
+                corner_plays = table.corner_plays[rows[j]][cols[j]][i]
+                plays.update([table.plays[index] for pid in range(NUM_PIECES) if player_pieces[turn][pid] for index in corner_plays[pid]])
+        candidates.append(np.array(sorted(plays), dtype=np.int64).reshape((-1, 4)))
+    num_candidates = sum([len(plays) for plays in candidates])
+    print('Legality checks for ' + str(num_candidates) + ' candidate plays over ' + str(len(positions)) + ' positions')
+
+    boards = [Board(board) for board, _, _ in positions]
+    start_time = time.time()
+    single = []
+    for i in range(len(positions)):
+        turn = positions[i][2]
+        single.append(np.array([boards[i].legal_play(turn, pieces[play[0]], play[1], play[2], play[3]) for play in candidates[i]], dtype=bool))
+    elapsed = time.time() - start_time
+    print('  legal_play: ' + str(int(num_candidates/elapsed)) + ' checks/s (' + str(round(elapsed, 2)) + ' s)')
+
+    start_time = time.time()
+    batched = [boards[i].legal_plays_batch(positions[i][2], candidates[i], pieces) for i in range(len(positions))]
+    elapsed = time.time() - start_time
+    print('  legal_plays_batch: ' + str(int(num_candidates/elapsed)) + ' checks/s (' + str(round(elapsed, 2)) + ' s)')
+    if not all([np.array_equal(single[i], batched[i]) for i in range(len(positions))]):
+        print('ERROR: legal_plays_batch disagrees with legal_play')
+
+
+if __name__ == '__main__':
+    pieces = read_pieces(PIECES_FILE)
+    positions = random_positions(pieces, 5)
+    bench_board_engines(pieces, positions)
+    bench_placement_tables(pieces, positions)
+    bench_batch_legality(pieces, positions)
@@ -0,0 +1,178 @@
+import numpy as np
+from constants import *
+from board import Board
+from zobrist import board_key, play_key
+
+#number of bits used for one row of the padded board
+BIT_STRIDE = BOARD_WIDTH + 2
+NUM_BOARD_BITS = (BOARD_HEIGHT+2)*BIT_STRIDE
+NUM_BOARD_BYTES = (NUM_BOARD_BITS+7)//8
+
+#bits for all cells that pieces can actually cover (i.e. everything except the padding)
+PLAYABLE_BITS = 0
+for _row in range(1, BOARD_HEIGHT+1):
+    PLAYABLE_BITS |= ((1 << BOARD_WIDTH) - 1) << (_row*BIT_STRIDE + 1)
+
+#the 4 padded corners, which every player treats as their own so that the first play touches a board corner
+SENTINEL_BITS = (1 << 0) | (1 << (BOARD_WIDTH+1)) | (1 << ((BOARD_HEIGHT+1)*BIT_STRIDE)) | (1 << (NUM_BOARD_BITS-1))
+
+
+#converts a padded (BOARD_HEIGHT+2)x(BOARD_WIDTH+2) bool array to an int, with cell (r,c) at bit r*BIT_STRIDE+c
+def array_to_bits(array):
+    packed = np.packbits(np.asarray(array, dtype=bool).ravel(), bitorder='little')
+    return int.from_bytes(packed.tobytes(), 'little')
+
+
+#converts an int back into a padded (BOARD_HEIGHT+2)x(BOARD_WIDTH+2) bool array
+def bits_to_array(bits):
+    packed = np.frombuffer(bits.to_bytes(NUM_BOARD_BYTES, 'little'), dtype=np.uint8)
+    unpacked = np.unpackbits(packed, bitorder='little')[:NUM_BOARD_BITS]
+    return unpacked.reshape((BOARD_HEIGHT+2, BOARD_WIDTH+2)).astype(bool)
+
+
+#a drop-in replacement for Board that stores the board as one integer bitboard per player
+#row r, column c of the padded board is bit r*BIT_STRIDE+c, which lines up with Piece.area_bits/adj_bits/diag_bits
+#so a legality check is just a few shifts and ANDs instead of slicing numpy arrays
+#board, adj_board and diag_board are not stored; board is rebuilt on request for printing and the like
+class BitBoard(Board):
+
+    def __init__(self, other_board=None):
+        self.init_dead_pieces(other_board)
+
+        #default constructor
+        if other_board is None:
+            self.occupied = 0
+            self.player_bits = [SENTINEL_BITS for _ in range(NUM_PLAYERS)]
+            self.key = 0
+
+        #constructs a board by deep copying a given BitBoard
+        elif isinstance(other_board, BitBoard):
+            self.occupied = other_board.occupied
+            self.player_bits = other_board.player_bits[:]
+            self.key = other_board.key
+
+        #constructs a board from a numpy array or another Board
+        elif isinstance(other_board, np.ndarray) or isinstance(other_board, Board):
+            if isinstance(other_board, Board):
+                other_board = other_board.board
+            num_rows = np.shape(other_board)[0]
+            num_cols = np.shape(other_board)[1]
+            if num_rows == BOARD_HEIGHT+2 and num_cols == BOARD_WIDTH+2:
+                padded = np.copy(other_board)
+            elif num_rows == BOARD_HEIGHT and num_cols == BOARD_WIDTH:
+                padded = np.zeros((BOARD_HEIGHT+2, BOARD_WIDTH+2), dtype=np.uint8)
+                padded[1:-1,1:-1] = other_board
+            else:
+                if VERBOSE:
+                    print("ERROR: numpy array of invalid size given to BitBoard constructor")
+                return
+            self.player_bits = [(array_to_bits(padded & (1 << i)) & PLAYABLE_BITS) | SENTINEL_BITS for i in range(NUM_PLAYERS)]
+            self.occupied = 0
+            for bits in self.player_bits:
+                self.occupied |= bits & PLAYABLE_BITS
+            self.key = board_key(padded)
+
+        else:
+            if VERBOSE:
+                print("ERROR: Invalid arguments given to BitBoard constructor")
+
+    #make a deep copy
+    def copy(self):
+        return BitBoard(self)
+
+    #the board as the same uint8 array that Board keeps
+    @property
+    def board(self):
+        board = np.zeros((BOARD_HEIGHT+2, BOARD_WIDTH+2), dtype=np.uint8)
+        for i in range(NUM_PLAYERS):
+            board |= np.uint8(1 << i)*bits_to_array(self.player_bits[i] & PLAYABLE_BITS)
+        board[0][0] = CORNER_SENTINEL
+        board[0][BOARD_WIDTH+1] = CORNER_SENTINEL
+        board[BOARD_HEIGHT+1][0] = CORNER_SENTINEL
+        board[BOARD_HEIGHT+1][BOARD_WIDTH+1] = CORNER_SENTINEL
+        return board
+
+    # returns True iff the given piece, orientation, and position satisfy the rules of Blokus
+    # note that player_id and piece_id inputs are assumed to be valid
+    def legal_play(self, player_id, piece, piece_or, row, col, verbose=False):
+        area_shape = piece.area_masks[piece_or].shape
+        if row < 0 or row+area_shape[0] > BOARD_HEIGHT or col < 0 or col+area_shape[1] > BOARD_WIDTH:
+            if verbose:
+                print('Row or Column out of range')
+            return False
+
+        shift = row*BIT_STRIDE + col
+        own_bits = self.player_bits[player_id]
+        if (piece.area_bits[piece_or] << (shift+BIT_STRIDE+1)) & self.occupied:
+            if verbose:
+                print('Overlapping another piece')
+            return False
+        if (piece.adj_bits[piece_or] << shift) & own_bits:
+            if verbose:
+                print('Directly adjacent to your own piece')
+            return False
+        if not (piece.diag_bits[piece_or] << shift) & own_bits:
+            if verbose:
+                print('Not diagonally touching your own piece')
+            return False
+        return True
+
+    #returns True iff placement index of a PlacementTable is legal for the given player
+    def legal_placement(self, player_id, table, index):
+        own_bits = self.player_bits[player_id]
+        return not (table.area_bits[index] & self.occupied) and not (table.adj_bits[index] & own_bits) and (table.diag_bits[index] & own_bits) != 0
+
+    #returns the legal placements out of a list of PlacementTable indices
+    def legal_placements(self, player_id, table, indices):
+        own_bits = self.player_bits[player_id]
+        occupied = self.occupied
+        area_bits = table.area_bits
+        adj_bits = table.adj_bits
+        diag_bits = table.diag_bits
+        return [index for index in indices if not (area_bits[index] & occupied) and not (adj_bits[index] & own_bits) and diag_bits[index] & own_bits]
+
+    #checks a whole array of PlacementTable indices at once, returning an array of bools
+    #the integer masks are already about as cheap as a numpy gather, so this just loops over them
+    def legal_placement_array(self, player_id, table, indices):
+        legal = set(self.legal_placements(player_id, table, [int(index) for index in indices]))
+        return np.array([int(index) in legal for index in indices], dtype=bool)
+
+    # updates the board state after a move has been made
+    # note that all parameters must correspond to a valid move
+    # returns an undo record for undo_play: the key and bits from before the play
+    def execute_play(self, player_id, piece, piece_or, row, col):
+        record = (self.key, self.occupied, player_id, self.player_bits[player_id])
+        self.key ^= play_key(player_id, piece, piece_or, row, col)
+        area_bits = piece.area_bits[piece_or] << (int(row+1)*BIT_STRIDE + int(col+1))
+        self.occupied |= area_bits
+        self.player_bits[player_id] |= area_bits
+        return record
+
+    #puts the board back the way it was before the execute_play that returned record (see Board.undo_play)
+    def undo_play(self, record):
+        self.key, self.occupied, player_id, self.player_bits[player_id] = record
+        self.clear_dead_pieces()
+
+    #locates the corners a player can build from, split into the 4 corner types (see Board.corners)
+    def corners(self, player_id):
+        own_bits = self.player_bits[player_id]
+        adj_bits = (own_bits << 1) | (own_bits >> 1) | (own_bits << BIT_STRIDE) | (own_bits >> BIT_STRIDE)
+        shifted_bits = [own_bits >> (BIT_STRIDE-1),
+                        own_bits >> (BIT_STRIDE+1),
+                        own_bits << (BIT_STRIDE-1),
+                        own_bits << (BIT_STRIDE+1)]
+        free_bits = PLAYABLE_BITS & ~self.occupied & ~adj_bits
+
+        ans = []
+        for i in range(4):
+            corner_bits = shifted_bits[i] & free_bits
+            rows = []
+            cols = []
+            while corner_bits:
+                low_bit = corner_bits & -corner_bits
+                row, col = divmod(low_bit.bit_length()-1, BIT_STRIDE)
+                rows.append(row)
+                cols.append(col)
+                corner_bits ^= low_bit
+            ans.append((rows, cols))
+        return ans
@@ -2,6 +2,8 @@ import numpy as np
 import random
 from constants import *
 from util import *
+from placements import get_placement_table
+from zobrist import board_key, play_key
 
 
 #NOT the complete game state
@@ -11,6 +13,12 @@ from util import *
 class Board:
 
     def __init__(self, other_board=None):
+        self.init_dead_pieces(other_board)
+
+        #boards that don't track adj_board and diag_board (e.g. a BitBoard) are rebuilt from their board array
+        if isinstance(other_board, Board) and not hasattr(other_board, 'adj_board'):
+            other_board = other_board.board
+
         #default constructor
         if other_board is None:
             #actual piece locations
@@ -30,11 +38,15 @@ class Board:
             self.diag_board[BOARD_HEIGHT][1] = CORNER_SENTINEL
             self.diag_board[BOARD_HEIGHT][BOARD_WIDTH] = CORNER_SENTINEL
 
+            #Zobrist key of the piece locations (see zobrist.py), kept up to date by execute_play
+            self.key = 0
+
         #constructs a board by deep copying a given Board
         elif isinstance(other_board, Board):
             self.board = np.copy(other_board.board)
             self.adj_board = np.copy(other_board.adj_board)
             self.diag_board = np.copy(other_board.diag_board)
+            self.key = other_board.key
 
         #constructs a board from a numpy array
         elif isinstance(other_board, np.ndarray):
@@ -53,6 +65,7 @@ class Board:
                 if VERBOSE:
                     print("ERROR: numpy array of invalid size given to Board constructor")
                 return
+            self.key = board_key(self.board)
             self.adj_board = np.zeros((BOARD_HEIGHT + 2, BOARD_WIDTH + 2), dtype=np.uint8)
             self.diag_board = np.zeros((BOARD_HEIGHT + 2, BOARD_WIDTH + 2), dtype=np.uint8)
             if EXTRA_TRACKING:
@@ -80,22 +93,39 @@ class Board:
             self.board = np.copy(other_board.board)
             self.adj_board = np.copy(other_board.adj_board)
             self.diag_board = np.copy(other_board.diag_board)
+            self.key = other_board.key
 
         else:
             if VERBOSE:
                 print("ERROR: Invalid arguments given to Board constructor")
 
 
+    #hashes on the Zobrist key, which covers the piece locations
     def __hash__(self):
-        return hash(self.board.tobytes())
+        return hash(self.key)
 
+    #Note: compares Zobrist keys rather than the boards themselves
     def __eq__(self, other):
-        return np.all(self.board==other.board)
+        return self.key == other.key
 
     #make a deep copy
     def copy(self):
         return Board(self)
 
+    #sets up dead_pieces, copying it from other_board if it is a Board
+    #dead_pieces[player_id] maps a corner (row, col, corner_type) to a bitmask of the piece IDs found not to fit there
+    #(see one_possible_play); plays only ever fill the board, so once a piece is dead at a corner it stays dead
+    def init_dead_pieces(self, other_board=None):
+        if isinstance(other_board, Board):
+            self.dead_pieces = [dict(dead) for dead in other_board.dead_pieces]
+        else:
+            self.dead_pieces = [{} for _ in range(NUM_PLAYERS)]
+
+    #forgets every player's dead pieces; used by undo_play, since a piece dead at a corner can fit again once plays are undone
+    def clear_dead_pieces(self):
+        for i in range(NUM_PLAYERS):
+            self.dead_pieces[i] = {}
+
 
     def print_board(self):
         if PRINT_COLOUR:
@@ -146,13 +176,55 @@ class Board:
             return False
         return True
 
+    #returns True iff placement index of a PlacementTable is legal for the given player
+    #placements are always in bounds, so only the board needs to be checked
+    def legal_placement(self, player_id, table, index):
+        play = table.plays[index]
+        return self.legal_play(player_id, table.pieces[play[0]], play[1], play[2], play[3], False)
+
+    #returns the legal placements out of a list of PlacementTable indices
+    def legal_placements(self, player_id, table, indices):
+        if len(indices) == 0:
+            return []
+        indices = np.asarray(indices, dtype=np.int64)
+        return indices[self.legal_placement_array(player_id, table, indices)].tolist()
+
+    #checks a whole array of PlacementTable indices at once, returning an array of bools
+    #each footprint is gathered from the flattened board with the table's cell index arrays
+    def legal_placement_array(self, player_id, table, indices):
+        flat_board = np.append(self.board.ravel(), np.uint8(0))
+        own_cells = flat_board & np.uint8(1 << player_id)
+        overlapping = np.any(flat_board[table.area_cells[indices]], axis=1)
+        adjacent = np.any(own_cells[table.adj_cells[indices]], axis=1)
+        diagonal = np.any(own_cells[table.diag_cells[indices]], axis=1)
+        return np.logical_not(overlapping) & np.logical_not(adjacent) & diagonal
+
+    #batched version of legal_play
+    #takes an Nx4 array (or list) of plays in the form (piece_id, piece_or, row, col) and returns N bools
+    #note that piece availability is not checked
+    def legal_plays_batch(self, player_id, plays, pieces):
+        table = get_placement_table(pieces)
+        indices = table.lookup_plays(plays)
+        ans = np.zeros(len(indices), dtype=bool)
+        in_bounds = indices >= 0
+        ans[in_bounds] = self.legal_placement_array(player_id, table, indices[in_bounds])
+        return ans
+
     # updates the board state after a move has been made
     # note that all parameters must correspond to a valid move
+    # returns an undo record for undo_play: the key and copies of the padded window around the piece
     def execute_play(self, player_id, piece, piece_or, row, col):
-        #update piece locations
         player_mask = 1 << player_id
         piece_stamp = player_mask*(piece.area_masks[piece_or])
         piece_shape = np.shape(piece_stamp)
+        window = (slice(row, row+piece_shape[0]+2), slice(col, col+piece_shape[1]+2))
+        if EXTRA_TRACKING:
+            record = (self.key, window, self.board[window].copy(), self.adj_board[window].copy(), self.diag_board[window].copy())
+        else:
+            record = (self.key, window, self.board[window].copy(), None, None)
+        self.key ^= play_key(player_id, piece, piece_or, row, col)
+
+        #update piece locations
         board_chunk = self.board[row+1:row+1+piece_shape[0],col+1:col+1+piece_shape[1]]
         self.board[row+1:row+1+piece_shape[0],col+1:col+1+piece_shape[1]] = np.bitwise_or(board_chunk,piece_stamp)
 
@@ -173,11 +245,24 @@ class Board:
             diag_stamp = player_mask*diag_stamp
             self.diag_board[row:row+piece_shape[0]+2,col:col+piece_shape[1]+2] = np.bitwise_or(diag_chunk, diag_stamp)
 
+        return record
 
-    #produces a tuple of all possible plays for the given player ID and piece ID list
-    #in the form (piece_id, piece_or, row, col)
-    def possible_plays(self, player_id, piece_ids_left, pieces):
-        ans = set()
+    #puts the board back the way it was before the execute_play that returned record
+    #plays have to be undone in the reverse order that they were made
+    def undo_play(self, record):
+        key, window, board_chunk, adj_chunk, diag_chunk = record
+        self.key = key
+        self.board[window] = board_chunk
+        if EXTRA_TRACKING:
+            self.adj_board[window] = adj_chunk
+            self.diag_board[window] = diag_chunk
+        self.clear_dead_pieces()
+
+
+    #locates the corners a player can build from, split into the 4 corner types
+    #returns a list of 4 (rows, cols) pairs in padded board coordinates
+    #corner type i is the one that the corners of type (i+2)%4 in Piece.diag_locs fit against
+    def corners(self, player_id):
         player_mask = 1 << player_id
         player_diags = np.bitwise_and(player_mask, self.diag_board)
 
@@ -187,8 +272,30 @@ class Board:
                           np.bitwise_and(np.pad(self.board[1:,1:],((0,1),(0,1)),'constant'),player_mask),
                           np.bitwise_and(np.pad(self.board[:bshp[0]-1,1:],((1,0),(0,1)),'constant'),player_mask),
                           np.bitwise_and(np.pad(self.board[:bshp[0]-1,:bshp[1]-1],((1,0),(1,0)),'constant'),player_mask)]
+        return [np.where(np.logical_and(shifted_boards[i],player_diags)) for i in range(4)]
+
+
+    #produces a tuple of all possible plays for the given player ID and piece ID list
+    #in the form (piece_id, piece_or, row, col)
+    def possible_plays(self, player_id, piece_ids_left, pieces):
+        ans = set()
+        corners = self.corners(player_id)
+        if PLACEMENT_TABLES:
+            table = get_placement_table(pieces)
+            live_pids = [pid for pid in range(len(piece_ids_left)) if piece_ids_left[pid]]
+            candidates = set()
+            for i in range(4):
+                rows, cols = corners[i]
+                for j in range(len(rows)):
+                    corner_plays = table.corner_plays[rows[j]][cols[j]][i]
+                    for pid in live_pids:
+                        candidates.update(corner_plays[pid])
+            for index in self.legal_placements(player_id, table, list(candidates)):
+                ans.add(table.plays[index])
+            return tuple(ans)
+
         for i in range(4):
-            rows, cols = np.where(np.logical_and(shifted_boards[i],player_diags))
+            rows, cols = corners[i]
             piece_i = (i+2) % 4
 
             #for each corner try all complimentary corners of all orientations of all available pieces
@@ -208,23 +315,48 @@ class Board:
 
 
     #produces one possible plays for the given player ID and piece ID list in the form (piece_id, piece_or, row, col)
+    #the play isn't uniform over all plays: a corner type is picked uniformly, then a corner of that type
+    #that something fits at, then a piece that fits there, then one of that piece's placements there
+    #with PLACEMENT_TABLES, pieces that don't fit at a corner are remembered in dead_pieces and never checked there again,
+    #and corners where nothing that's left fits are skipped without checking anything (this doesn't change the odds)
     def one_possible_play(self, player_id, piece_ids_left, pieces):
         ans = None
-        player_mask = 1 << player_id
-        player_diags = np.bitwise_and(player_mask, self.diag_board)
-
-        #locate corners for each of 4 types
-        bshp = np.shape(self.board)
-        shifted_boards = [np.bitwise_and(np.pad(self.board[1:,:bshp[1]-1],((0,1),(1,0)),'constant'),player_mask),
-                          np.bitwise_and(np.pad(self.board[1:,1:],((0,1),(0,1)),'constant'),player_mask),
-                          np.bitwise_and(np.pad(self.board[:bshp[0]-1,1:],((1,0),(0,1)),'constant'),player_mask),
-                          np.bitwise_and(np.pad(self.board[:bshp[0]-1,:bshp[1]-1],((1,0),(1,0)),'constant'),player_mask)]
+        corners = self.corners(player_id)
+        if PLACEMENT_TABLES:
+            table = get_placement_table(pieces)
+            dead_pieces = self.dead_pieces[player_id]
+            live_pids = [pid for pid in range(len(piece_ids_left)) if piece_ids_left[pid]]
+            live_mask = 0
+            for pid in live_pids:
+                live_mask |= 1 << pid
         r_4 = list(range(4))
         random.shuffle(r_4)
         for i in r_4:
-            rows, cols = np.where(np.logical_and(shifted_boards[i],player_diags))
+            rows, cols = corners[i]
             piece_i = (i+2) % 4
 
+            if PLACEMENT_TABLES:
+                r_rows = list(range(len(rows)))
+                random.shuffle(r_rows)
+                for j in r_rows:
+                    corner = (rows[j], cols[j], i)
+                    dead = dead_pieces.get(corner, 0)
+                    if not live_mask & ~dead:
+                        continue
+                    #check the whole corner in one go, then pick a random piece and a random placement of it
+                    corner_plays = table.corner_plays[rows[j]][cols[j]][i]
+                    candidates = [index for pid in live_pids if not (dead >> pid) & 1 for index in corner_plays[pid]]
+                    legal = self.legal_placements(player_id, table, candidates)
+                    legal_pids = list(set([table.plays[index][0] for index in legal]))
+                    legal_mask = 0
+                    for pid in legal_pids:
+                        legal_mask |= 1 << pid
+                    dead_pieces[corner] = dead | (live_mask & ~legal_mask)
+                    if legal:
+                        pid = random.choice(legal_pids)
+                        return table.plays[random.choice([index for index in legal if table.plays[index][0] == pid])]
+                continue
+
             #for each corner try all complimentary corners of all orientations of all available pieces
             r_rows = list(range(len(rows)))
             random.shuffle(r_rows)
@@ -1,65 +1,127 @@
-import os
-import json
-import numpy as np
+"""
+Running this file scans every game in the archive at GAME_ARCHIVE_FILE for positions matching a set of filters
+(by default, positions 20 turns from the end with more than 200 possible plays)
+and writes the matches to FOUND_POSITIONS_FILE, one JSON object per line.
+Games are spread over a pool of worker processes, and positions are replayed one turn at a time as they're scanned.
+"""
 
+import json
+import multiprocessing
 from constants import *
-from board import *
-from player import Player
-from random_bot import RandomBot
-from stat_calculator import *
-from game import *
-from piece import *
-from colorama import Fore, Back, Style, init
-
-'''
-Looks for files in "game_data/"
-enter a game number to select a game
-enter a turn number to select a turn 
-or hit enter to jump to the next turn
-
-'''
-
-
-all_data = []
-for root, dirs, files in os.walk("game_data"):   
-    for file in files:
-        if file.endswith(".txt"):
-            d = json.load(open(root + "/" + file, "r"))
-            all_data.append(d)
-           
-#list of games from individual perspectives
-
-print("ready")
-
-game_num = 0
-
-turns_from_end = 20
-
-for curr_game in all_data:
-	turn_num = 0
-
-	pieces = read_pieces(PIECES_FILE)
-	players = [RandomBot(i) for i in range(NUM_PLAYERS)]
-	game = Game(pieces, players)
-	
-	states = curr_game["states"]
-	turn = states[-1*turns_from_end]
-	game.board = Board(idtobits(np.array(turn["board"])))
-	player = turn["player_turn"]-1
-	
-	if(len(game.possible_plays()) > 200):
-		game.board.print_board()
-		print("game: " + str(game_num))
-		print("possible_plays: " + str(len(game.possible_plays())))
-		print("player: " + str(turn["player_turn"]-1))
-		print(turn["pieces_left"])
-		
-		game_input = input("enter for next ")
-		if(game_input == "n" or game_input == ""):
-			game_num += 1
-		elif(game_input == "exit" or game_input = "e"):
-			break
-	
-#interesting games:
-#599
+from piece import read_pieces
+from game_archive import GameArchive, apply_recorded_play
+from state_codec import encode_game
+
+FOUND_POSITIONS_FILE = 'found_positions.jsonl'
+SCAN_CHUNK_SIZE = 64 #games handed to a worker at a time
+
+
+#a position reached while scanning a game: the state after turn_num of the game's num_turns turns
+#the branching factor is only worked out if a filter asks for it
+class ScannedPosition:
+    def __init__(self, game, game_num, turn_num, num_turns):
+        self.game = game
+        self.game_num = game_num
+        self.turn_num = turn_num
+        self.num_turns = num_turns
+        self.num_plays = None
+
+    #the number of plays available to the player to move (0 if they've finished)
+    def branching(self):
+        if self.num_plays is None:
+            player = self.game.players[self.game.turn]
+            self.num_plays = 0 if player.finished else len(self.game.possible_plays())
+        return self.num_plays
+
+
+#filters for scan_positions; each one is called with a ScannedPosition and returns True to keep it
+#they're classes rather than closures so that they can be sent to worker processes
+#MinBranching keeps positions where the player to move has more than min_plays plays
+class MinBranching:
+    def __init__(self, min_plays):
+        self.min_plays = min_plays
+
+    def __call__(self, position):
+        return position.branching() > self.min_plays
+
+class TurnsFromEnd:
+    def __init__(self, turns):
+        self.turns = turns
+
+    def __call__(self, position):
+        return position.num_turns - position.turn_num == self.turns
+
+class PlayerToMove:
+    def __init__(self, player_id):
+        self.player_id = player_id
+
+    def __call__(self, position):
+        return position.game.turn == self.player_id
+
+
+#yields the positions of the given games that pass every filter, replaying each game one turn at a time
+#filters are tried in order, so cheap ones should go before MinBranching
+def scan_positions(archive, game_nums, pieces, filters):
+    for game_num in game_nums:
+        plays = archive.game_plays(game_num)
+        game = archive.game_at(game_num, 0, pieces)
+        for turn_num in range(len(plays)+1):
+            position = ScannedPosition(game, game_num, turn_num, len(plays))
+            if all(position_filter(position) for position_filter in filters):
+                yield position
+            if turn_num < len(plays):
+                apply_recorded_play(game, plays[turn_num])
+
+#what gets written out for a matching position; state is the position encoded by state_codec.encode_game, in hex
+def position_record(position):
+    return {'game': position.game_num, 'turn': position.turn_num, 'turns_from_end': position.num_turns-position.turn_num,
+            'player': position.game.turn, 'branching': position.branching(), 'state': encode_game(position.game).hex()}
+
+
+#the pieces are read once per worker process
+worker_pieces = None
+
+#scans one chunk of games in a worker process
+#args is a tuple (archive path, list of game numbers, filters); returns a list of position_records
+def scan_chunk(args):
+    global worker_pieces
+    path, game_nums, filters = args
+    if worker_pieces is None:
+        worker_pieces = read_pieces(PIECES_FILE)
+    archive = GameArchive(path)
+    records = [position_record(position) for position in scan_positions(archive, game_nums, worker_pieces, filters)]
+    archive.close()
+    return records
+
+#scans every game in the archive at path, writing the positions that pass every filter to output_file
+#chunks of games are spread over num_workers processes (all cores if None, or run in this process if 1)
+#and results are written as soon as each chunk is done, so the order of the lines isn't fixed
+#returns the number of positions found
+def find_positions(filters, path=GAME_ARCHIVE_FILE, output_file=FOUND_POSITIONS_FILE, num_workers=None, chunk_size=SCAN_CHUNK_SIZE):
+    archive = GameArchive(path)
+    num_games = archive.num_games()
+    archive.close()
+    jobs = [(path, list(range(start, min(start+chunk_size, num_games))), filters) for start in range(0, num_games, chunk_size)]
+
+    if num_workers == 1:
+        results = map(scan_chunk, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(scan_chunk, jobs)
+    num_found = 0
+    with open(output_file, 'w') as out:
+        for i, records in enumerate(results):
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+            num_found += len(records)
+            if VERBOSE:
+                print('Scanned ' + str(min((i+1)*chunk_size, num_games)) + '/' + str(num_games) + ' games, ' + str(num_found) + ' positions found')
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return num_found
+
 
+if __name__ == '__main__':
+    find_positions([TurnsFromEnd(20), MinBranching(200)])
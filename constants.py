@@ -6,9 +6,24 @@ NUM_PLAYERS = 4
 ALL_ONES = 255
 CORNER_SENTINEL = ALL_ONES
 NUM_STATS_GAMES = 100
+NUM_STATS_WORKERS = None #processes used by calc_stats; None uses every core
 PIECES_FILE = 'pieces.txt'
+PIECES_CACHE_SUFFIX = '.cache' #read_pieces keeps the built Pieces next to the pieces file, with this added to its name
+PIECES_CACHE_VERSION = 1 #change this whenever Piece changes, so that old caches are rebuilt
 VERBOSE = True
 EXTRA_TRACKING = True
+BOARD_ENGINE = 'numpy' #'numpy' for Board, 'bitboard' for BitBoard
+PLACEMENT_TABLES = True #generate plays from precomputed per-corner placement lists (see placements.py)
+ZOBRIST_SEED = 20180401 #seed for the Zobrist hashing keys in zobrist.py
+TT_SLOTS = 2**20 #slots in a TranspositionTable; each one takes about 34 bytes
+GAME_ARCHIVE_FILE = 'game_data/games.blka' #archive of recorded games (see game_archive.py)
+ENDGAME_MAX_NODES = 20000 #node budget for each EndgameSolver.solve
+ENDGAME_BRANCHING = 20 #MCTSBot tries solving exactly once the players still in the game have this many plays between them
+MCTS_MAX_NODES = 50000 #node budget for an MCTS tree kept across turns; MCTSTree nodes take roughly 5-10 KB each
+MCTS_PRUNE_FRACTION = 0.75 #when the budget is hit, trees are pruned down to this fraction of it
+PLAYOUT_BATCH = 256 #games a BatchPlayout plays in lockstep, for calc_random_stats and MCTS in 'batch' mode
+ROOT_PARALLEL_MARGIN = 0.05 #seconds that root-parallel MCTS workers stop early by, to leave time for merging their results
+VIRTUAL_LOSS = 1 #lost visits counted on each node of a pending simulation's path during tree-parallel MCTS
 TRACK_STATS = True
 PRINT_COLOUR = True
 
@@ -18,13 +33,19 @@ if PRINT_COLOUR:
     FORE_ARRAY = [Fore.RED, Fore.BLUE, Fore.GREEN, Fore.YELLOW]
     BACK_ARRAY = [Back.RED, Back.BLUE, Back.GREEN, Back.YELLOW]
 
+#makes an empty dict for stats
+def new_stats():
+    stats = {}
+    stats['num_games'] = 0
+    stats['num_wins'] = [0 for _ in range(4)]
+    stats['game_time'] = []
+    stats['num_plays'] = []
+    stats['num_branch'] = []
+    stats['avg_branch'] = []
+    stats['max_branch'] = []
+    stats['max_branch_turn'] = []
+    return stats
+
 #global vars for stats
-stats = {}
-stats['num_games'] = 0
-stats['num_wins'] = [0 for _ in range(4)]
-stats['game_time'] = []
-stats['num_plays'] = []
-stats['num_branch'] = []
-stats['avg_branch'] = []
-stats['max_branch'] = []
-stats['max_branch_turn'] = []
\ No newline at end of file
+#these are only written to by the process playing the game; calc_stats merges them across processes
+stats = new_stats()
\ No newline at end of file
@@ -0,0 +1,137 @@
+import time
+from constants import *
+from game_state import game_state
+
+#returns the number of plays available to the players still in the game, summed over players
+def remaining_branching(game):
+    num_plays = 0
+    for player_id in range(NUM_PLAYERS):
+        if not game.is_player_finished(player_id):
+            num_plays += len(game.possible_plays(player_id))
+    return num_plays
+
+
+#a paranoid alpha-beta solver for the end of a game
+#player_id maximizes the margin min(other players' scores) - own score, and every other player tries to minimize it
+#so a proven margin >= 0 means player_id is guaranteed to finish tied for the lead or better whatever the others do
+#the search deepens one ply at a time, trying the previous best play first, until it's proven or the budget runs out
+#plays are tried in order of decreasing piece value; passes by finished players don't count towards the depth
+#positions at the depth limit are scored with the current margin, which makes the result unproven
+class EndgameSolver:
+    def __init__(self, game, player_id=None, max_nodes=ENDGAME_MAX_NODES, max_time=None):
+        #the solver plays on its own GameState, so bots never hear about its plays
+        self.game = game_state(game)
+        self.player_id = game.turn if player_id is None else player_id
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.end_time = None
+        self.num_nodes = 0
+        self.depth_reached = 0
+        self.out_of_budget = False
+        self.complete = True
+
+    #min(other players' scores) - player_id's score
+    def evaluate(self):
+        scores = self.game.get_scores()
+        return min([scores[i] for i in range(NUM_PLAYERS) if i != self.player_id]) - scores[self.player_id]
+
+    #the current player's plays, biggest pieces first
+    def ordered_plays(self):
+        pieces = self.game.pieces
+        return sorted(self.game.possible_plays(), key=lambda play: (-pieces[play[0]].value, play))
+
+    #returns the paranoid value of the current position, searching depth plies below it
+    #returns 0 and sets out_of_budget if the budget runs out
+    def search(self, depth, alpha, beta):
+        game = self.game
+        self.num_nodes += 1
+        if self.num_nodes > self.max_nodes or (self.end_time is not None and time.time() > self.end_time):
+            self.out_of_budget = True
+            return 0
+        if game.is_finished():
+            return self.evaluate()
+
+        if game.is_player_finished(game.turn):
+            undo = game.pass_turn()
+            value = self.search(depth, alpha, beta)
+            game.undo_play(undo)
+            return value
+        if depth == 0:
+            self.complete = False
+            return self.evaluate()
+        plays = self.ordered_plays()
+        if not plays: #current player has just run out of plays
+            undo = game.pass_turn(retire=True)
+            value = self.search(depth, alpha, beta)
+            game.undo_play(undo)
+            return value
+
+        maximizing = game.turn == self.player_id
+        best_value = None
+        for play in plays:
+            undo = game.execute_play(game.turn, play[0], play[1], play[2], play[3])
+            value = self.search(depth-1, alpha, beta)
+            game.undo_play(undo)
+            if self.out_of_budget:
+                return 0
+            if maximizing:
+                if best_value is None or value > best_value:
+                    best_value = value
+                alpha = max(alpha, value)
+            else:
+                if best_value is None or value < best_value:
+                    best_value = value
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        return best_value
+
+    #searches each of the root's plays depth plies deep, in order, and returns (best play, its value)
+    def search_root(self, plays, depth):
+        best_play = None
+        best_value = None
+        alpha = -START_SCORE - 1
+        beta = START_SCORE + 1
+        for play in plays:
+            undo = self.game.execute_play(self.game.turn, play[0], play[1], play[2], play[3])
+            value = self.search(depth-1, alpha, beta)
+            self.game.undo_play(undo)
+            if self.out_of_budget:
+                return None, None
+            if best_value is None or value > best_value:
+                best_play = play
+                best_value = value
+                alpha = max(alpha, value)
+        return best_play, best_value
+
+    #finds a play for player_id, who must be the player to move
+    #returns a tuple (play, margin, proven), where play is of the form (piece_id, piece_or, row, col)
+    #if proven is False, play and margin come from the deepest search that finished inside the budget
+    #a player without any plays gets (-1,-1,-1,-1)
+    def solve(self):
+        if self.max_time is not None:
+            self.end_time = time.time() + self.max_time
+        if VERBOSE and self.game.turn != self.player_id:
+            print('ERROR: EndgameSolver can only solve for the player to move')
+        plays = [] if self.game.is_player_finished(self.game.turn) else self.ordered_plays()
+        if not plays:
+            return (-1,-1,-1,-1), self.evaluate(), False
+
+        best_play = plays[0]
+        best_value = self.evaluate()
+        proven = False
+        depth = 1
+        while True:
+            self.complete = True
+            play, value = self.search_root(plays, depth)
+            if self.out_of_budget:
+                break
+            best_play = play
+            best_value = value
+            self.depth_reached = depth
+            if self.complete:
+                proven = True
+                break
+            plays = [play] + [other for other in plays if other != play]
+            depth += 1
+        return best_play, best_value, proven
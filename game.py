@@ -1,6 +1,16 @@
-import numpy as np
 from constants import *
 from board import Board
+from bitboard import BitBoard
+from zobrist import ZOBRIST_PIECES, ZOBRIST_FINISHED, ZOBRIST_TURN
+
+#builds a new board with the engine selected by BOARD_ENGINE
+#takes the same arguments as the Board constructor
+def make_board(board=None):
+    if BOARD_ENGINE == 'bitboard':
+        return BitBoard(board)
+    if VERBOSE and BOARD_ENGINE != 'numpy':
+        print('ERROR: Unrecognized board engine')
+    return Board(board)
 
 #keeps the whole game state
 class Game:
@@ -10,10 +20,10 @@ class Game:
         self.players = players
         self.pieces = pieces
         if board is None:
-            self.board = Board()
+            self.board = make_board()
             self.turn = 0
         else:
-            self.board = Board(board)
+            self.board = make_board(board)
             self.turn = turn
             for i in range(len(player_pieces)):
                 curr = player_pieces[i]
@@ -23,16 +33,34 @@ class Game:
                         score -= pieces[p_id].value
                 self.players[i].pieces = curr
                 self.players[i].score = score
+        #Zobrist key of the pieces used and the turn (see zobrist.py), kept up to date by execute_play and pass_turn
+        self.key = self.pieces_key() ^ ZOBRIST_TURN[self.turn]
+
+    #computes the Zobrist key of the pieces every player has used from scratch
+    def pieces_key(self):
+        key = 0
+        for i in range(len(self.players)):
+            for p_id in range(len(self.players[i].pieces)):
+                if not self.players[i].pieces[p_id]:
+                    key ^= ZOBRIST_PIECES[i][p_id]
+        return key
+
+    #the full Zobrist key of the game state: piece locations, pieces used, finished flags and turn
+    #finished flags are folded in here, since players' finished flags get set directly
+    def state_key(self):
+        key = self.key ^ self.board.key
+        for i in range(len(self.players)):
+            if self.players[i].finished:
+                key ^= ZOBRIST_FINISHED[i]
+        return key
 
     #Note: does not hash on pieces
     def __hash__(self):
-        player_tuple = tuple([hash(player) for player in self.players])
-        return hash((hash(self.board),self.turn)+player_tuple)
+        return hash(self.state_key())
 
-    #Note: does not compare pieces
+    #Note: compares Zobrist keys rather than the states themselves
     def __eq__(self, other):
-        player_bool = np.all([self.players[i]==other.players[i] for i in range(len(self.players))])
-        return self.board==other.board and player_bool and self.turn==other.turn
+        return self.state_key() == other.state_key()
 
     #make a deep copy
     #the list of pieces will be deep copied only if deep_copy_pieces is set to True
@@ -46,6 +74,7 @@ class Game:
         new_game = Game(new_pieces, new_players)
         new_game.board = self.board.copy()
         new_game.turn = self.turn
+        new_game.key = self.key
         return new_game
 
     #returns True iff the player actually has the piece chosen and the board position is valid
@@ -60,22 +89,50 @@ class Game:
 
     #updates the game state after a move has been made
     #note that all parameters must correspond to a valid move
+    #returns an undo record for undo_play
     def execute_play(self, player_id, piece_id, piece_or, row, col):
         if VERBOSE and player_id != self.turn:
             print("Player " + str(player_id) + " is playing out of turn!")
         for p in self.players:
             p.receive_play(self, (player_id, piece_id, piece_or, row, col))
         player = self.players[player_id]
+        record = (player_id, piece_id, player.score, player.finished, self.turn, self.key)
         player.pieces[piece_id] = False
         player.score -= self.pieces[piece_id].value
-        self.board.execute_play(player_id, self.pieces[piece_id], piece_or, row, col)
+        board_record = self.board.execute_play(player_id, self.pieces[piece_id], piece_or, row, col)
+        self.key ^= ZOBRIST_PIECES[player_id][piece_id] ^ ZOBRIST_TURN[self.turn]
         self.turn = (self.turn+1) % NUM_PLAYERS
+        self.key ^= ZOBRIST_TURN[self.turn]
+        return record + (board_record,)
 
     #move to the next turn without doing anything
-    def pass_turn(self):
+    #if retire is True, the current player is also marked as finished
+    #returns an undo record for undo_play
+    def pass_turn(self, retire=False):
         for p in self.players:
             p.receive_play(self, (self.turn, -1, -1, -1, -1))
+        player = self.players[self.turn]
+        record = (self.turn, -1, player.score, player.finished, self.turn, self.key, None)
+        if retire:
+            player.finished = True
+        self.key ^= ZOBRIST_TURN[self.turn]
         self.turn = (self.turn+1) % NUM_PLAYERS
+        self.key ^= ZOBRIST_TURN[self.turn]
+        return record
+
+    #takes back the play or pass that returned record, restoring the board, the player's pieces, score and finished flag,
+    #the turn and the key exactly
+    #plays have to be undone in the reverse order that they were made, and players are not told about it
+    def undo_play(self, record):
+        player_id, piece_id, score, finished, turn, key, board_record = record
+        player = self.players[player_id]
+        if piece_id != -1:
+            player.pieces[piece_id] = True
+            self.board.undo_play(board_record)
+        player.score = score
+        player.finished = finished
+        self.turn = turn
+        self.key = key
 
     #produces a tuple of all possible plays for the given player ID
     #in the form (piece_id, piece_or, row, col)
@@ -90,6 +147,18 @@ class Game:
             player_id = self.turn
         return self.board.one_possible_play(player_id, self.players[player_id].pieces,self.pieces)
 
+    #returns True if the given player has finished playing
+    def is_player_finished(self, player_id):
+        return self.players[player_id].finished
+
+    #sets the given player's finished flag directly (pass_turn(retire=True) also retires the player to move)
+    def set_finished(self, player_id, finished):
+        self.players[player_id].finished = finished
+
+    #returns a list of every player's score
+    def get_scores(self):
+        return [player.score for player in self.players]
+
     #returns True if the game is over, else returns False
     def is_finished(self):
         game_finished = True
@@ -109,9 +178,26 @@ class Game:
         return leaders
 
 
+#plays random moves on game (a Game or a GameState) until it's over, changing game in place
+#returns a list of the player IDs of the winners
+def random_playout(game):
+    while not game.is_finished():
+        if not game.is_player_finished(game.turn):
+            play = game.one_possible_play()
+            if play is None:
+                game.set_finished(game.turn, True)
+            else:
+                game.execute_play(game.turn, play[0], play[1], play[2], play[3])
+                continue
+        game.pass_turn()
+    return game.get_leaders()
+
+
 #play a 4-player game of Blokus
 #takes a list of Pieces and Players as input
-def play_game(pieces, players):
+#if recorder is given (e.g. a game_archive.GameRecorder), every turn is passed to recorder.record_play as
+#(player_id, piece_id, piece_or, row, col), with a piece_id of -1 for passes, and recorder.end_game is called at the end
+def play_game(pieces, players, recorder=None):
     global stats
     if TRACK_STATS:
         stats['num_games'] += 1
@@ -135,12 +221,22 @@ def play_game(pieces, players):
                     if VERBOSE and not valid_play:
                         print('ERROR: Illegal play')
             if piece_id >= 0:
+                if recorder is not None:
+                    recorder.record_play((game.turn, piece_id, piece_or, row, col))
                 game.execute_play(game.turn, piece_id, piece_or, row, col)
             else:
+                if recorder is not None:
+                    recorder.record_play((game.turn, -1, -1, -1, -1))
                 game.pass_turn()
         else:
+            if recorder is not None:
+                recorder.record_play((game.turn, -1, -1, -1, -1))
             game.pass_turn()
         game_finished = game.is_finished()
+    if recorder is not None:
+        recorder.end_game()
+    for player in players:
+        player.close()
 
     scores = [player.score for player in game.players]
     min_score = min(scores)
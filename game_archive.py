@@ -0,0 +1,283 @@
+import os
+import mmap
+import json
+import numpy as np
+from constants import *
+from game import Game, make_board
+from player import Player
+from placements import get_placement_table
+from state_codec import encode_game, decode_game
+
+#an append-only archive of games stored as move lists, in two files:
+#   path          - ARCHIVE_MAGIC, then one record per game: a little endian uint16 number of turns,
+#                   then PLY_BYTES bytes per turn (see encode_ply)
+#   path + '.idx' - INDEX_MAGIC, then a little endian uint64 per game with the offset of its record in path
+#every turn of play_game gets an entry, including passes, so turn T of a game is the state after its first T entries
+#both files are read through mmap, so opening an archive doesn't depend on how many games it holds
+
+ARCHIVE_MAGIC = b'BLKARC01'
+INDEX_MAGIC = b'BLKIDX01'
+INDEX_SUFFIX = '.idx'
+PLY_BYTES = 3
+PASS_PIECE = 31
+
+#packs a play (player_id, piece_id, piece_or, row, col) into PLY_BYTES bytes; a piece_id of -1 is a pass
+#bits 0-1 are player_id, 2-6 piece_id (PASS_PIECE for a pass), 7-9 piece_or, 10-14 row and 15-19 col
+def encode_ply(play):
+    player_id, piece_id, piece_or, row, col = play
+    if piece_id == -1:
+        word = player_id | (PASS_PIECE << 2)
+    else:
+        word = player_id | (piece_id << 2) | (piece_or << 7) | (row << 10) | (col << 15)
+    return word.to_bytes(PLY_BYTES, 'little')
+
+#unpacks the plays from a buffer of PLY_BYTES-byte entries made by encode_ply
+def decode_plies(data):
+    raw = np.frombuffer(data, dtype=np.uint8).reshape((-1, PLY_BYTES)).astype(np.int64)
+    words = raw[:,0] | (raw[:,1] << 8) | (raw[:,2] << 16)
+    plays = []
+    for word in words.tolist():
+        piece_id = (word >> 2) & 31
+        if piece_id == PASS_PIECE:
+            plays.append((word & 3, -1, -1, -1, -1))
+        else:
+            plays.append((word & 3, piece_id, (word >> 7) & 7, (word >> 10) & 31, (word >> 15) & 31))
+    return plays
+
+
+#appends games to an archive, creating it if it doesn't exist yet
+class GameArchiveWriter:
+    def __init__(self, path=GAME_ARCHIVE_FILE):
+        self.path = path
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        new_archive = not os.path.exists(path)
+        if not new_archive and not os.path.exists(path + INDEX_SUFFIX):
+            rebuild_index(path)
+        self.data_file = open(path, 'ab')
+        self.index_file = open(path + INDEX_SUFFIX, 'ab')
+        if new_archive:
+            self.data_file.write(ARCHIVE_MAGIC)
+            self.index_file.write(INDEX_MAGIC)
+        self.num_games = (self.index_file.tell() - len(INDEX_MAGIC)) // 8
+
+    #adds a game given as a list of plays (player_id, piece_id, piece_or, row, col), one per turn
+    #returns the game's number in the archive
+    def add_game(self, plays):
+        return self.add_encoded_game(len(plays), b''.join([encode_ply(play) for play in plays]))
+
+    #adds a game whose num_turns plays have already been packed by encode_ply into plies
+    def add_encoded_game(self, num_turns, plies):
+        offset = self.data_file.tell()
+        self.data_file.write(num_turns.to_bytes(2, 'little') + plies)
+        self.index_file.write(offset.to_bytes(8, 'little'))
+        self.num_games += 1
+        return self.num_games - 1
+
+    #writes everything out so that readers opened afterwards can see it
+    def flush(self):
+        self.data_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+
+#collects the turns of games run by play_game (pass it as the recorder)
+#plays are packed as they come in and the whole game is handed to writer in one write when it ends
+#without a writer, the last game is just kept in last_game as (num_turns, plies) for add_encoded_game
+class GameRecorder:
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.plies = bytearray()
+        self.num_turns = 0
+        self.last_game = None
+
+    def record_play(self, play):
+        self.plies += encode_ply(play)
+        self.num_turns += 1
+
+    def end_game(self):
+        self.last_game = (self.num_turns, bytes(self.plies))
+        if self.writer is not None:
+            self.writer.add_encoded_game(self.num_turns, self.last_game[1])
+        self.plies = bytearray()
+        self.num_turns = 0
+
+
+#scans the records of an archive to write its index file from scratch
+#this is the only operation that reads the whole archive
+def rebuild_index(path=GAME_ARCHIVE_FILE):
+    offsets = []
+    with open(path, 'rb') as data_file:
+        data = data_file.read()
+    offset = len(ARCHIVE_MAGIC)
+    while offset + 2 <= len(data):
+        offsets.append(offset)
+        offset += 2 + PLY_BYTES*int.from_bytes(data[offset:offset+2], 'little')
+    with open(path + INDEX_SUFFIX, 'wb') as index_file:
+        index_file.write(INDEX_MAGIC + b''.join([o.to_bytes(8, 'little') for o in offsets]))
+
+
+#random access to the games in an archive
+#games added after the archive is opened aren't seen until it's opened again
+class GameArchive:
+    #an archive that doesn't exist is reported and opened as one with no games
+    def __init__(self, path=GAME_ARCHIVE_FILE):
+        self.path = path
+        if not os.path.exists(path):
+            if VERBOSE:
+                print('ERROR: ' + path + ' does not exist')
+            self.data = None
+            self.offsets = np.zeros(0, dtype='<u8')
+            return
+        if not os.path.exists(path + INDEX_SUFFIX):
+            rebuild_index(path)
+        self.data_file = open(path, 'rb')
+        self.index_file = open(path + INDEX_SUFFIX, 'rb')
+        self.data = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_data = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if VERBOSE and (self.data[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC or self.index_data[:len(INDEX_MAGIC)] != INDEX_MAGIC):
+            print('ERROR: ' + path + ' is not a game archive')
+        self.offsets = np.frombuffer(self.index_data, dtype='<u8', offset=len(INDEX_MAGIC))
+
+    def num_games(self):
+        return len(self.offsets)
+
+    #the number of turns recorded for game game_num
+    def num_turns(self, game_num):
+        offset = int(self.offsets[game_num])
+        return int.from_bytes(self.data[offset:offset+2], 'little')
+
+    #the plays of game game_num, one per turn, in the form (player_id, piece_id, piece_or, row, col)
+    def game_plays(self, game_num):
+        offset = int(self.offsets[game_num])
+        num_turns = int.from_bytes(self.data[offset:offset+2], 'little')
+        return decode_plies(self.data[offset+2:offset+2+PLY_BYTES*num_turns])
+
+    #rebuilds the board of game game_num after its first turn_num turns
+    def board_at(self, game_num, turn_num, pieces):
+        board = make_board()
+        for player_id, piece_id, piece_or, row, col in self.game_plays(game_num)[:turn_num]:
+            if piece_id != -1:
+                board.execute_play(player_id, pieces[piece_id], piece_or, row, col)
+        return board
+
+    #rebuilds game game_num after its first turn_num turns, with plain Players unless players are given
+    def game_at(self, game_num, turn_num, pieces, players=None):
+        return GameReplay(self.game_plays(game_num), pieces).game_at(turn_num, players)
+
+    #a GameReplay of game game_num, for looking at many of its turns
+    def replay(self, game_num, pieces, checkpoint_every=None):
+        return GameReplay(self.game_plays(game_num), pieces, checkpoint_every)
+
+    def close(self):
+        self.offsets = None
+        if self.data is None:
+            return
+        self.data.close()
+        self.index_data.close()
+        self.data_file.close()
+        self.index_file.close()
+
+
+#applies one recorded turn to game; a pass retires the player, as it does in play_game
+def apply_recorded_play(game, play):
+    player_id, piece_id, piece_or, row, col = play
+    if piece_id == -1:
+        game.pass_turn(retire=True)
+    else:
+        game.execute_play(player_id, piece_id, piece_or, row, col)
+
+
+#rebuilds the Game at any turn of a recorded list of plays (one per turn, as from play_game's recorder)
+#if checkpoint_every is set, the game is played through once up front and its state is kept (by state_codec)
+#every checkpoint_every turns, so that game_at only has to replay from the nearest checkpoint
+class GameReplay:
+    def __init__(self, plays, pieces, checkpoint_every=None):
+        self.plays = plays
+        self.pieces = pieces
+        self.checkpoint_every = checkpoint_every
+        self.checkpoints = []
+        if checkpoint_every is not None:
+            game = Game(pieces, [Player(i) for i in range(NUM_PLAYERS)])
+            for turn_num in range(len(plays)+1):
+                if turn_num % checkpoint_every == 0:
+                    self.checkpoints.append(encode_game(game))
+                if turn_num < len(plays):
+                    apply_recorded_play(game, plays[turn_num])
+
+    def num_turns(self):
+        return len(self.plays)
+
+    #the Game after the first turn_num turns, with plain Players unless players are given
+    #(the players' pieces, scores and finished flags are overwritten)
+    def game_at(self, turn_num, players=None):
+        if players is None:
+            players = [Player(i) for i in range(NUM_PLAYERS)]
+        if self.checkpoints:
+            start = min(turn_num // self.checkpoint_every, len(self.checkpoints)-1)
+            game = decode_game(self.checkpoints[start], self.pieces, players)
+            start *= self.checkpoint_every
+        else:
+            game = Game(self.pieces, players)
+            start = 0
+        for play in self.plays[start:turn_num]:
+            apply_recorded_play(game, play)
+        return game
+
+
+#works out the plays between the boards of a JSON game record (the "states" written to game_data/)
+#boards hold player numbers 1-4 with 0 for empty cells; each new piece is matched to a placement by its cells,
+#and players that get skipped over are given passes, as play_game does for finished players
+def json_game_plays(states, pieces):
+    table = get_placement_table(pieces)
+    placements_by_cells = {}
+    for index in range(len(table.plays)):
+        placements_by_cells.setdefault(table.area_bits[index], index)
+    stride = BOARD_WIDTH + 2
+
+    plays = []
+    prev_board = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), dtype=np.int64)
+    turn = 0
+    for state in states:
+        curr_board = np.array(state['board'], dtype=np.int64)
+        rows, cols = np.nonzero(curr_board != prev_board)
+        if len(rows) == 0:
+            continue
+        cells = 0
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            cells |= 1 << ((row+1)*stride + col+1)
+        owners = set(curr_board[rows, cols].tolist())
+        if len(owners) != 1 or cells not in placements_by_cells:
+            if VERBOSE:
+                print('ERROR: JSON game record has a board change that is not one piece')
+            return None
+        player_id = owners.pop() - 1
+        while turn != player_id:
+            plays.append((turn, -1, -1, -1, -1))
+            turn = (turn+1) % NUM_PLAYERS
+        plays.append((player_id,) + tuple(table.plays[placements_by_cells[cells]]))
+        turn = (turn+1) % NUM_PLAYERS
+        prev_board = curr_board
+    return plays
+
+#adds every JSON game record (*.txt) under directory to the archive at path
+#returns the number of games added
+def import_json_games(directory='game_data', path=GAME_ARCHIVE_FILE, pieces=None):
+    if pieces is None:
+        from piece import read_pieces
+        pieces = read_pieces(PIECES_FILE)
+    writer = GameArchiveWriter(path)
+    num_added = 0
+    for root, dirs, files in sorted(os.walk(directory)):
+        for file in sorted(files):
+            if file.endswith('.txt'):
+                with open(os.path.join(root, file), 'r') as json_file:
+                    plays = json_game_plays(json.load(json_file)['states'], pieces)
+                if plays is not None:
+                    writer.add_game(plays)
+                    num_added += 1
+    writer.close()
+    return num_added
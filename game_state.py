@@ -0,0 +1,152 @@
+import numpy as np
+from constants import *
+from game import Game
+from player import Player
+from zobrist import ZOBRIST_PIECES, ZOBRIST_FINISHED, ZOBRIST_TURN
+
+#a compact game state for searches and rollouts, with no Player objects
+#every player's pieces are rows of one NUM_PLAYERS x NUM_PIECES bool array, and scores and finished flags are short lists,
+#so a copy is the board plus a few small copies; nobody is told about plays
+#it has the parts of Game's interface that the search code uses (see is_player_finished, set_finished and get_scores),
+#so trees, rollouts and solvers can run on either
+class GameState:
+    __slots__ = ('pieces', 'board', 'piece_ids_left', 'scores', 'finished', 'turn', 'key')
+
+    #an empty board with player 0 to move
+    def __init__(self, pieces):
+        game = Game(pieces, [Player(i) for i in range(NUM_PLAYERS)])
+        self.pieces = pieces
+        self.board = game.board
+        self.piece_ids_left = np.ones((NUM_PLAYERS, NUM_PIECES), dtype=bool)
+        self.scores = [START_SCORE for _ in range(NUM_PLAYERS)]
+        self.finished = [False for _ in range(NUM_PLAYERS)]
+        self.turn = 0
+        self.key = game.key
+
+    #Note: does not hash on pieces
+    def __hash__(self):
+        return hash(self.state_key())
+
+    #Note: compares Zobrist keys rather than the states themselves
+    def __eq__(self, other):
+        return self.state_key() == other.state_key()
+
+    #make a deep copy (the list of pieces is shared)
+    def copy(self):
+        new_state = GameState.__new__(GameState)
+        new_state.pieces = self.pieces
+        new_state.board = self.board.copy()
+        new_state.piece_ids_left = self.piece_ids_left.copy()
+        new_state.scores = self.scores[:]
+        new_state.finished = self.finished[:]
+        new_state.turn = self.turn
+        new_state.key = self.key
+        return new_state
+
+    #the full Zobrist key of the state, the same as Game.state_key for the same position
+    def state_key(self):
+        key = self.key ^ self.board.key
+        for i in range(NUM_PLAYERS):
+            if self.finished[i]:
+                key ^= ZOBRIST_FINISHED[i]
+        return key
+
+    #makes a Game with this state, using players (plain Players if None) whose pieces, scores and finished flags are overwritten
+    def to_game(self, players=None):
+        if players is None:
+            players = [Player(i) for i in range(NUM_PLAYERS)]
+        game = Game(self.pieces, players)
+        for i in range(NUM_PLAYERS):
+            players[i].pieces = self.piece_ids_left[i].copy()
+            players[i].score = self.scores[i]
+            players[i].finished = self.finished[i]
+        game.board = self.board.copy()
+        game.turn = self.turn
+        game.key = self.key
+        return game
+
+    #returns True iff the player actually has the piece chosen and the board position is valid
+    def legal_play(self, player_id, piece_id, piece_or, row, col, verbose=False):
+        if piece_id < 0 or piece_id >= NUM_PIECES or not self.piece_ids_left[player_id][piece_id]:
+            if VERBOSE:
+                print('Piece ID invalid or already used')
+            return False
+        return self.board.legal_play(player_id, self.pieces[piece_id], piece_or, row, col, verbose)
+
+    #updates the state after a move has been made (see Game.execute_play)
+    #returns an undo record for undo_play
+    def execute_play(self, player_id, piece_id, piece_or, row, col):
+        if VERBOSE and player_id != self.turn:
+            print("Player " + str(player_id) + " is playing out of turn!")
+        record = (player_id, piece_id, self.scores[player_id], self.finished[player_id], self.turn, self.key)
+        self.piece_ids_left[player_id][piece_id] = False
+        self.scores[player_id] -= self.pieces[piece_id].value
+        board_record = self.board.execute_play(player_id, self.pieces[piece_id], piece_or, row, col)
+        self.key ^= ZOBRIST_PIECES[player_id][piece_id] ^ ZOBRIST_TURN[self.turn]
+        self.turn = (self.turn+1) % NUM_PLAYERS
+        self.key ^= ZOBRIST_TURN[self.turn]
+        return record + (board_record,)
+
+    #move to the next turn without doing anything, retiring the current player if retire is True
+    #returns an undo record for undo_play
+    def pass_turn(self, retire=False):
+        record = (self.turn, -1, self.scores[self.turn], self.finished[self.turn], self.turn, self.key, None)
+        if retire:
+            self.finished[self.turn] = True
+        self.key ^= ZOBRIST_TURN[self.turn]
+        self.turn = (self.turn+1) % NUM_PLAYERS
+        self.key ^= ZOBRIST_TURN[self.turn]
+        return record
+
+    #takes back the play or pass that returned record (see Game.undo_play)
+    def undo_play(self, record):
+        player_id, piece_id, score, finished, turn, key, board_record = record
+        if piece_id != -1:
+            self.piece_ids_left[player_id][piece_id] = True
+            self.board.undo_play(board_record)
+        self.scores[player_id] = score
+        self.finished[player_id] = finished
+        self.turn = turn
+        self.key = key
+
+    def possible_plays(self, player_id=None):
+        if player_id is None:
+            player_id = self.turn
+        return self.board.possible_plays(player_id, self.piece_ids_left[player_id], self.pieces)
+
+    def one_possible_play(self, player_id=None):
+        if player_id is None:
+            player_id = self.turn
+        return self.board.one_possible_play(player_id, self.piece_ids_left[player_id], self.pieces)
+
+    def is_player_finished(self, player_id):
+        return self.finished[player_id]
+
+    def set_finished(self, player_id, finished):
+        self.finished[player_id] = finished
+
+    def get_scores(self):
+        return self.scores[:]
+
+    def is_finished(self):
+        return all(self.finished)
+
+    #returns a list of the player IDs of players currently in the lead
+    def get_leaders(self):
+        min_score = min(self.scores)
+        return [i for i in range(NUM_PLAYERS) if self.scores[i] == min_score]
+
+
+#makes a GameState with the same state as game (a Game or another GameState)
+def game_state(game):
+    if isinstance(game, GameState):
+        return game.copy()
+    new_state = GameState.__new__(GameState)
+    new_state.pieces = game.pieces
+    new_state.board = game.board.copy()
+    new_state.piece_ids_left = np.array([player.pieces for player in game.players], dtype=bool)
+    new_state.scores = [player.score for player in game.players]
+    new_state.finished = [player.finished for player in game.players]
+    new_state.turn = game.turn
+    new_state.key = game.key
+    return new_state
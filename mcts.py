@@ -1,9 +1,15 @@
 import numpy as np
 import time
-import math
+import random
+import multiprocessing
 from constants import *
 from player import Player
-from game import Game
+from game import random_playout
+from game_state import GameState, game_state
+from mcts_array import ArrayMCTSTree
+from endgame import EndgameSolver, remaining_branching
+from batch_playout import batch_playouts
+from selection import ucb1_scores, puct_scores, unvisited_puct_score, play_priors
 
 class MCTSNode:
     def __init__(self, game, last_play, parent):
@@ -14,43 +20,215 @@ class MCTSNode:
         self.score = (0,0)
         self.num_sims = 0
         self.num_wins = 0
+        #simulations that have passed through this node but haven't been backpropagated yet (see MCTSTree.add_virtual_loss)
+        self.num_pending = 0
         self.expanded = False
+        #plays that don't have a child yet, in random order (filled in when the node is expanded)
+        #when expanded with priors, they're sorted by prior so that the last one has the highest
+        self.untried_plays = None
+        self.play_priors = None
+        #the children's statistics as arrays, in the order the children were made, for scoring them all at once
+        #child_sims, child_wins and child_pending mirror each child's num_sims, num_wins and num_pending,
+        #and index is this node's own position in its parent's arrays
+        self.child_nodes = []
+        self.child_sims = np.zeros(0, dtype=np.int64)
+        self.child_wins = np.zeros(0, dtype=np.int64)
+        self.child_pending = np.zeros(0, dtype=np.int64)
+        self.child_priors = np.zeros(0, dtype=np.float64)
+        self.index = None
+
+    #works out which plays can be made from this node, without making any children yet
+    #a player without any plays gets a single pass play, which also marks them as finished
+    #if use_priors is set, every play also gets a prior (see selection.play_priors) for PUCT
+    def expand(self, use_priors=False):
+        turn = self.game.turn
+        if self.game.is_player_finished(turn):
+            possible_plays = []
+        else:
+            possible_plays = [(turn,)+play for play in self.game.possible_plays()]
+        if not possible_plays:
+            possible_plays = [(turn, -1, -1, -1, -1)]
+        if use_priors:
+            self.play_priors = dict(zip(possible_plays, play_priors(possible_plays, self.game.pieces)))
+            for play, child in self.children.items():
+                self.child_priors[child.index] = self.play_priors.get(play, 0.0)
+        self.untried_plays = [play for play in possible_plays if play not in self.children]
+        random.shuffle(self.untried_plays)
+        if use_priors:
+            self.untried_plays.sort(key=self.play_priors.get)
+        self.reserve(len(self.child_nodes)+len(self.untried_plays))
+        self.expanded = True
+
+    #makes sure the child arrays have room for num_children children
+    def reserve(self, num_children):
+        capacity = len(self.child_sims)
+        if num_children <= capacity:
+            return
+        capacity = max(num_children, 2*capacity)
+        self.child_sims = np.resize(self.child_sims, capacity)
+        self.child_wins = np.resize(self.child_wins, capacity)
+        self.child_pending = np.resize(self.child_pending, capacity)
+        self.child_priors = np.resize(self.child_priors, capacity)
+
+    #adds child to the children under play, giving it the next slot in the child arrays
+    def attach_child(self, play, child):
+        num_children = len(self.child_nodes)
+        self.reserve(num_children+1)
+        child.index = num_children
+        self.child_nodes.append(child)
+        self.children[play] = child
+        self.child_sims[num_children] = child.num_sims
+        self.child_wins[num_children] = child.num_wins
+        self.child_pending[num_children] = child.num_pending
+        self.child_priors[num_children] = self.play_priors.get(play, 0.0) if self.play_priors is not None else 0.0
+
+    #forgets every child, leaving this node unexpanded with only its own statistics
+    def clear_children(self):
+        self.children = {}
+        self.child_nodes = []
+        self.child_sims = np.zeros(0, dtype=np.int64)
+        self.child_wins = np.zeros(0, dtype=np.int64)
+        self.child_pending = np.zeros(0, dtype=np.int64)
+        self.child_priors = np.zeros(0, dtype=np.float64)
+        self.untried_plays = None
+        self.play_priors = None
+        self.expanded = False
+
+    #makes the child for one of the untried plays, copying this node's game only now
+    def add_child(self, play):
+        self.untried_plays.remove(play)
+        new_child = MCTSNode(self.game, play, self)
+        if play[1] == -1:
+            new_child.game.pass_turn(retire=True)
+        else:
+            new_child.game.execute_play(play[0], play[1], play[2], play[3], play[4])
+        self.attach_child(play, new_child)
+        return new_child
+
+
+#worker for leaf-parallel search: plays out a (pickled, so already copied) game with its own seed
+def parallel_playout(args):
+    game, seed = args
+    random.seed(seed)
+    return random_playout(game)
+
+
+#worker for root-parallel search: builds and searches a whole tree from game with its own seed until time.time() reaches end_time
+#(a deadline rather than a length, so that however long the worker took to start is taken out of its search)
+#returns a dict mapping each of the root's plays to its (num_sims, num_wins)
+def parallel_search(args):
+    game, player_id, end_time, explore_param, selection_method, rollout_heuristic, store_rollouts, seed = args
+    random.seed(seed)
+    max_time = max(end_time - time.time(), 0.0)
+    tree = MCTSTree(game, player_id, max_time, explore_param, selection_method, rollout_heuristic, store_rollouts=store_rollouts)
+    tree.expand_tree()
+    return tree.root_stats()
 
 
 class MCTSTree:
-    def __init__(self, game, player_id, max_time, explore_param=1.414, selection_method='ucb1', rollout_heuristic=None):
-        self.root = MCTSNode(game, None, None)
+    #selection_method is 'ucb1' or 'puct' (PUCT, with priors from selection.play_priors)
+    #parallel_mode can be None, 'root', 'leaf' or 'tree', using num_workers processes:
+    #   'root' - every worker searches its own tree from the root and their root statistics are added up
+    #   'leaf' - each expanded node is evaluated with num_workers rollouts at once
+    #   'tree' - num_workers descents are made with virtual losses and their leaves are played out at once
+    #   'batch' - like 'tree', but playout_batch leaves are played out together in this process by a BatchPlayout
+    #if store_rollouts is set, every simulated play of a rollout is kept in the tree as a node
+    #otherwise rollouts are played out on one scratch copy of the game and only the results are kept
+    #the tree is kept from turn to turn (see rebase_tree); once it has more than max_nodes nodes, the subtrees with the
+    #fewest simulations are evicted (see prune_tree), and None lets it grow without limit
+    def __init__(self, game, player_id, max_time, explore_param=1.414, selection_method='ucb1', rollout_heuristic=None,
+                 num_workers=1, parallel_mode=None, store_rollouts=False, max_nodes=MCTS_MAX_NODES, playout_batch=PLAYOUT_BATCH):
+        self.root = MCTSNode(game_state(game), None, None)
         self.start_time = None
         self.player_id = player_id
         self.max_time = max_time
         self.explore_param = explore_param
         self.selection_method = selection_method
         self.rollout_heuristic = rollout_heuristic
+        self.num_workers = num_workers
+        self.parallel_mode = parallel_mode
+        self.store_rollouts = store_rollouts
+        self.pool = None
+        self.merged_stats = None
+        self.max_nodes = max_nodes
+        self.playout_batch = playout_batch
+        self.num_nodes = 1
+        #the number of simulations already under the root at the start of each search, i.e. inherited from earlier turns
+        self.inherited_sims = []
+
+    #worker pools can't be pickled or copied, so leave it out
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
 
-    def ucb1(self, wins, node_sims):
-        total_sims = self.root.num_sims
-        return float(wins)/float(node_sims) + self.explore_param*math.sqrt(math.log(total_sims)/float(node_sims))
+    #returns the pool of worker processes, starting it the first time
+    #returns None if this process can't start workers (e.g. it is itself a pool worker)
+    def get_pool(self):
+        if self.pool is None:
+            if multiprocessing.current_process().daemon:
+                if VERBOSE:
+                    print('ERROR: Parallel MCTS is not available inside a worker process; searching serially')
+                self.parallel_mode = None
+                return None
+            self.pool = multiprocessing.Pool(self.num_workers)
+        return self.pool
 
+    #shuts down the worker processes, if any were started
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    #scores every child of node at once with the selection method and returns the best one
+    #pending simulations count as visits that were lost (virtual losses), steering other descents elsewhere
     def select_child(self, node):
-        curr_node = node
-        best_score = None
-        best_child = None
-        for _, child in curr_node.children.items():
-            if child.num_sims == 0:
-                return child
-            else:
-                if self.selection_method == 'ucb1':
-                    curr_score = self.ucb1(child.num_wins, child.num_sims)
-                    if best_score is None or curr_score > best_score:
-                        best_score = curr_score
-                        best_child = child
-                else:
-                    if VERRBOSE:
-                        print('ERROR: Unrecognized MCTS selection method')
-                    return None
-        return best_child
+        num_children = len(node.child_nodes)
+        sims = node.child_sims[:num_children] + node.child_pending[:num_children]
+        wins = node.child_wins[:num_children]
+        parent_sims = node.num_sims + node.num_pending
+        if self.selection_method == 'ucb1':
+            scores = ucb1_scores(wins, sims, parent_sims, self.explore_param)
+        elif self.selection_method == 'puct':
+            scores = puct_scores(wins, sims, node.child_priors[:num_children], parent_sims, self.explore_param)
+        else:
+            if VERBOSE:
+                print('ERROR: Unrecognized MCTS selection method')
+            return None
+        return node.child_nodes[int(np.argmax(scores))]
+
+    #returns True if node should make a child for its next untried play instead of selecting an existing child
+    #with UCB1 every play is tried once first; with PUCT only once the best untried prior outscores every child
+    def should_add_child(self, node):
+        if not node.untried_plays:
+            return False
+        if self.selection_method != 'puct' or not node.child_nodes:
+            return True
+        num_children = len(node.child_nodes)
+        parent_sims = node.num_sims + node.num_pending
+        new_score = unvisited_puct_score(node.play_priors[node.untried_plays[-1]], parent_sims, self.explore_param)
+        scores = puct_scores(node.child_wins[:num_children], node.child_sims[:num_children] + node.child_pending[:num_children],
+                             node.child_priors[:num_children], parent_sims, self.explore_param)
+        return new_score >= np.max(scores)
+
+    #walks down from the root with select_child until it makes a new child or reaches the end of the game
+    #returns the node to simulate from
+    def descend(self):
+        curr_node = self.root
+        while not curr_node.game.is_finished():
+            if not curr_node.expanded:
+                curr_node.expand(self.selection_method == 'puct')
+            if self.should_add_child(curr_node):
+                self.num_nodes += 1
+                return curr_node.add_child(curr_node.untried_plays[-1])
+            curr_node = self.select_child(curr_node)
+        return curr_node
 
     def rollout(self, node):
+        if not self.store_rollouts:
+            self.playout(node)
+            return
         curr_node = node
         while not curr_node.game.is_finished():
             if len(curr_node.children) == 0:
@@ -62,107 +240,240 @@ class MCTSTree:
                         print('ERROR: Unrecognized rollout heuristic')
                 new_game = curr_node.game.copy()
                 if play is None:
-                    new_game.players[new_game.turn].finished = True
-                    new_game.pass_turn()
+                    new_game.pass_turn(retire=True)
                     new_child = MCTSNode(new_game, (curr_node.game.turn, -1, -1, -1, -1), curr_node)
                 else:
                     new_game.execute_play(new_game.turn, play[0], play[1], play[2], play[3])
                     new_child = MCTSNode(new_game, (curr_node.game.turn,)+play, curr_node)
-                curr_node.children[new_child.last_play] = new_child
+                curr_node.attach_child(new_child.last_play, new_child)
+                self.num_nodes += 1
                 curr_node = new_child
             else:
                 curr_node = next(iter(curr_node.children.values()))
         self.backprop(curr_node, curr_node.game.get_leaders())
 
+    #plays the node's game out to the end on a single scratch copy and backpropagates the winners
+    #nothing is added to the tree
+    def playout(self, node):
+        if self.rollout_heuristic is not None and VERBOSE:
+            print('ERROR: Unrecognized rollout heuristic')
+        winners = random_playout(node.game.copy())
+        self.backprop(node, winners)
+
+    #walks back up from node to the root, counting wins for the player who made the play leading into each node
+    #and keeping the parent's child arrays in step
     def backprop(self, node, winners):
-        if node.game.turn in winners:
-            node.num_wins += 1
-        node.num_sims += 1
-        if node.parent is not None:
-            self.backprop(node.parent, winners)
+        while node is not None:
+            node.num_sims += 1
+            if node.last_play is not None and node.last_play[0] in winners:
+                node.num_wins += 1
+            if node is self.root:
+                break
+            node.parent.child_sims[node.index] = node.num_sims
+            node.parent.child_wins[node.index] = node.num_wins
+            node = node.parent
+
+    #marks a simulation as pending on every node from node up to the root, counting VIRTUAL_LOSS lost visits for each
+    #until remove_virtual_loss is called with the same node
+    def add_virtual_loss(self, node, amount=VIRTUAL_LOSS):
+        while node is not None:
+            node.num_pending += amount
+            if node is self.root:
+                break
+            node.parent.child_pending[node.index] = node.num_pending
+            node = node.parent
+
+    def remove_virtual_loss(self, node):
+        self.add_virtual_loss(node, -VIRTUAL_LOSS)
 
     #perform MCTS to expand the current tree up to some maximum
-    #max is the maximum time (in seconds) for which the search can run
-    def expand_tree(self):
-        finished = False
-        curr_node = self.root
+    #max_time is the maximum time (in seconds) for which the search can run, self.max_time if None
+    def expand_tree(self, max_time=None):
+        if max_time is None:
+            max_time = self.max_time
         start_time = time.time()
+        self.inherited_sims.append(self.root.num_sims)
+        if self.parallel_mode == 'root' and self.get_pool() is not None:
+            self.expand_tree_root_parallel(max_time, start_time)
+            return
+        finished = False
         while not finished:
-            while curr_node.expanded and not curr_node.game.is_finished():
-                curr_node = self.select_child(curr_node)
-            if not curr_node.game.is_finished():
-                possible_plays = curr_node.game.possible_plays()
-                if not possible_plays:
-                    new_game = curr_node.game.copy()
-                    new_game.players[new_game.turn].finished = True
-                    new_game.pass_turn()
-                    new_child = MCTSNode(new_game, (curr_node.game.turn, -1, -1, -1, -1), curr_node)
-                    curr_node.children[new_child.last_play] = new_child
+            if self.parallel_mode == 'tree' and self.get_pool() is not None:
+                self.expand_tree_batch(self.num_workers, self.pool_playouts)
+            elif self.parallel_mode == 'batch':
+                self.expand_tree_batch(self.playout_batch, batch_playouts)
+            else:
+                curr_node = self.descend()
+                if self.parallel_mode == 'leaf' and not curr_node.game.is_finished() and self.get_pool() is not None:
+                    jobs = [(curr_node.game, random.getrandbits(32)) for _ in range(self.num_workers)]
+                    for winners in self.pool.map(parallel_playout, jobs):
+                        self.backprop(curr_node, winners)
                 else:
-                    for play in possible_plays:
-                        new_game = curr_node.game.copy()
-                        new_game.execute_play(new_game.turn, play[0], play[1], play[2], play[3])
-                        new_child = MCTSNode(new_game, (curr_node.game.turn,)+play, curr_node)
-                        curr_node.children[new_child.last_play] = new_child
+                    self.rollout(curr_node)
+            if self.max_nodes is not None and self.num_nodes > self.max_nodes:
+                self.prune_tree()
 
-            curr_node.expanded = True
-            self.rollout(curr_node)
-            curr_node = self.root
-
-            if time.time()-start_time >= self.max_time:
+            if time.time()-start_time >= max_time:
                 finished = True
 
+    #tree-parallel search step: num_leaves descents are made one after another, each leaving virtual losses on its path
+    #so that the next one is steered elsewhere, then all of their leaves are played out at once by play_out,
+    #which takes a list of games and returns a list of the winners of each
+    def expand_tree_batch(self, num_leaves, play_out):
+        leaves = []
+        for _ in range(num_leaves):
+            leaf = self.descend()
+            self.add_virtual_loss(leaf)
+            leaves.append(leaf)
+        for leaf, winners in zip(leaves, play_out([leaf.game for leaf in leaves])):
+            self.remove_virtual_loss(leaf)
+            self.backprop(leaf, winners)
+
+    #plays out each of games on the worker processes
+    def pool_playouts(self, games):
+        return self.pool.map(parallel_playout, [(game, random.getrandbits(32)) for game in games])
+
+    #root-parallel search: every worker searches its own tree and the root statistics are added up
+    #workers stop ROOT_PARALLEL_MARGIN seconds before max_time is up, leaving time to send back and merge their statistics
+    #the merged statistics are kept in merged_stats until the next play is received
+    def expand_tree_root_parallel(self, max_time, start_time):
+        end_time = start_time + max_time - ROOT_PARALLEL_MARGIN
+        jobs = [(self.root.game, self.player_id, end_time, self.explore_param, self.selection_method,
+                 self.rollout_heuristic, self.store_rollouts, random.getrandbits(32)) for _ in range(self.num_workers)]
+        self.merged_stats = {}
+        for worker_stats in self.pool.map(parallel_search, jobs):
+            for play, (num_sims, num_wins) in worker_stats.items():
+                merged = self.merged_stats.get(play, (0,0))
+                self.merged_stats[play] = (merged[0]+num_sims, merged[1]+num_wins)
+
+    #returns a dict mapping each of the root's plays to its (num_sims, num_wins)
+    #after a root-parallel search, these are the statistics merged over all of the workers
+    def root_stats(self):
+        if self.merged_stats is not None:
+            return self.merged_stats
+        return {play: (child.num_sims, child.num_wins) for play, child in self.root.children.items()}
+
     #return the best play currently available
     def get_best_play(self):
-        if not self.root.children:
+        play_stats = self.root_stats()
+        if not play_stats:
             return (-1,-1,-1,-1)
         else:
             best_score = None
             best_play = None
-            missed_count = 0
-            for _, child in self.root.children.items():
-                if child.num_sims != 0:
-                    curr_score = float(child.num_wins)/child.num_sims
+            missed_count = len(self.root.untried_plays) if self.root.untried_plays else 0
+            for play, (num_sims, num_wins) in play_stats.items():
+                if num_sims != 0:
+                    curr_score = float(num_wins)/num_sims
                     if best_score is None or curr_score > best_score:
                         best_score = curr_score
-                        best_play = child.last_play[1:]
+                        best_play = play[1:]
                 else:
                     missed_count += 1
-            print(str(missed_count) + '/' + str(len(self.root.children)))
+            print(str(missed_count) + '/' + str(len(play_stats)+missed_count))
         return best_play
 
     #preserves some of the previously generated game tree when new moves have bee played
     #takes a tuple, play, of the form (player_id, piece_id, piece_or, row, col)
+    #everything that can't be reached from the new root any more is dropped straight away
     def rebase_tree(self, play):
-        if play in self.root.children:
-            self.root = self.root.children[play]
+        self.merged_stats = None
+        old_root = self.root
+        if play in old_root.children:
+            new_root = old_root.children[play]
+            old_root.child_nodes.pop(new_root.index)
+            new_root.parent = None
+            new_root.index = None
+            self.num_nodes -= self.discard_children(old_root) + 1
         else:
-            new_game = self.root.game.copy()
+            new_root = MCTSNode(old_root.game, play, None)
             if play[1] == -1:
-                new_game.pass_turn()
+                new_root.game.pass_turn(retire=True)
             else:
-                new_game.execute_play(play[0], play[1], play[2], play[3], play[4])
-            new_root = MCTSNode(new_game, play, None)
-            self.root = new_root
+                new_root.game.execute_play(play[0], play[1], play[2], play[3], play[4])
+            self.discard_children(old_root)
+            self.num_nodes = 1
+        self.root = new_root
 
+    #drops every node under node (but not node itself), unlinking them from their parents so that they're freed at once
+    #rather than whenever the garbage collector gets to the reference cycles
+    #returns the number of nodes dropped
+    def discard_children(self, node):
+        num_dropped = 0
+        stack = [node]
+        while stack:
+            curr_node = stack.pop()
+            for child in curr_node.child_nodes:
+                child.parent = None
+            num_dropped += len(curr_node.child_nodes)
+            stack.extend(curr_node.child_nodes)
+            curr_node.clear_children()
+        return num_dropped
 
+    #evicts subtrees, fewest simulations first, until the tree is down to MCTS_PRUNE_FRACTION of max_nodes
+    #an evicted subtree's top node stays in the tree with its statistics, and is expanded again if selection comes back to it
+    def prune_tree(self):
+        target = int(self.max_nodes*MCTS_PRUNE_FRACTION)
+        candidates = []
+        stack = list(self.root.child_nodes)
+        while stack:
+            node = stack.pop()
+            if node.child_nodes:
+                candidates.append(node)
+                stack.extend(node.child_nodes)
+        candidates.sort(key=lambda node: node.num_sims)
+        for node in candidates:
+            if self.num_nodes <= target:
+                break
+            self.num_nodes -= self.discard_children(node)
+
+
+#tree_storage picks the tree implementation: 'nodes' for MCTSTree or 'arrays' for ArrayMCTSTree
 class MCTSBot(Player):
-    def __init__(self, id, pieces, max_time, explore_param, selection_method, rollout_heuristic):
+    def __init__(self, id, pieces, max_time, explore_param, selection_method, rollout_heuristic, num_workers=1, parallel_mode=None,
+                 store_rollouts=False, tree_storage='nodes', endgame_branching=ENDGAME_BRANCHING, max_nodes=MCTS_MAX_NODES,
+                 playout_batch=PLAYOUT_BATCH):
         Player.__init__(self,id)
-        self.tree = MCTSTree(Game(pieces, [Player(i) for i in range(NUM_PLAYERS)]), id, max_time, explore_param, selection_method, rollout_heuristic)
+        self.all_pieces = pieces
+        self.tree_storage = tree_storage
+        self.endgame_branching = endgame_branching
+        if tree_storage == 'arrays':
+            tree_class = ArrayMCTSTree
+        else:
+            if VERBOSE and tree_storage != 'nodes':
+                print('ERROR: Unrecognized MCTS tree storage')
+            tree_class = MCTSTree
+        self.tree = tree_class(GameState(pieces), id, max_time, explore_param, selection_method,
+                               rollout_heuristic, num_workers, parallel_mode, store_rollouts, max_nodes=max_nodes,
+                               playout_batch=playout_batch)
 
+    #once the players still in the game have at most endgame_branching plays between them (None turns this off),
+    #tries to solve the rest of the game exactly first, and only searches the tree if that can't be proven in time
+    #the tree search then gets whatever is left of max_time
     def get_play(self, game):
-        self.tree.expand_tree()
+        start_time = time.time()
+        if self.endgame_branching is not None and remaining_branching(game) <= self.endgame_branching:
+            play, margin, proven = EndgameSolver(game, self.id, max_time=self.tree.max_time).solve()
+            if proven:
+                return play
+        self.tree.expand_tree(max(self.tree.max_time - (time.time()-start_time), 0.0))
         if VERBOSE:
             game.board.print_board()
+            print('Inherited ' + str(self.tree.inherited_sims[-1]) + ' simulations from earlier turns')
         return self.tree.get_best_play()
 
     def receive_play(self, game, play):
         self.tree.rebase_tree(play)
 
+    #shuts down the tree's worker processes, if it started any
+    def close(self):
+        self.tree.close_pool()
+
     #make a deep copy (tree is reset, not copied)
     def copy(self):
-        new_player = MCTSBot(self.id,self.tree.root.game.pieces,self.tree.max_time,self.tree.explore_param,self.tree.selection_method,self.tree.rollout_heuristic)
+        new_player = MCTSBot(self.id,self.all_pieces,self.tree.max_time,self.tree.explore_param,self.tree.selection_method,self.tree.rollout_heuristic,
+                             self.tree.num_workers,self.tree.parallel_mode,self.tree.store_rollouts,self.tree_storage,
+                             self.endgame_branching,self.tree.max_nodes,self.tree.playout_batch)
         new_player.score = self.score
         new_player.pieces = np.copy(self.pieces)
         new_player.finished = self.finished
@@ -0,0 +1,250 @@
+import numpy as np
+import time
+import random
+from constants import *
+from game import random_playout
+from game_state import game_state
+from selection import ucb1_scores, puct_scores, play_priors
+
+#an MCTS tree stored in flat numpy arrays instead of MCTSNode objects
+#node i has num_sims[i], num_wins[i], its parent's index in parent[i], and the play leading to it in plays[i]
+#the children of a node are allocated together when it's expanded, as the block first_child[i]:first_child[i]+num_children[i]
+#so selection scores all of a node's children with one vectorized argmax (see selection.py)
+#games are not stored in the tree; every iteration replays the plays from the root on one scratch copy of the root game
+#wins are counted for the player who made the play leading into a node (plays[i][0])
+#like MCTSTree, the tree is kept from turn to turn and pruned once it has more than max_nodes nodes
+class ArrayMCTSTree:
+    def __init__(self, game, player_id, max_time, explore_param=1.414, selection_method='ucb1', rollout_heuristic=None,
+                 num_workers=1, parallel_mode=None, store_rollouts=False, max_nodes=MCTS_MAX_NODES, playout_batch=PLAYOUT_BATCH,
+                 capacity=1024):
+        self.root_game = game_state(game)
+        self.player_id = player_id
+        self.max_time = max_time
+        self.explore_param = explore_param
+        self.selection_method = selection_method
+        self.rollout_heuristic = rollout_heuristic
+        self.num_workers = num_workers
+        self.parallel_mode = parallel_mode
+        self.store_rollouts = store_rollouts
+        self.playout_batch = playout_batch
+        if VERBOSE and (parallel_mode is not None or store_rollouts):
+            print('ERROR: ArrayMCTSTree does not support parallel search or stored rollouts')
+
+        self.num_sims = np.zeros(capacity, dtype=np.int64)
+        self.num_wins = np.zeros(capacity, dtype=np.int64)
+        self.parent = -np.ones(capacity, dtype=np.int32)
+        self.first_child = -np.ones(capacity, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        #(player_id, piece_id, piece_or, row, col), with piece_id -1 for a pass
+        self.plays = -np.ones((capacity, 5), dtype=np.int16)
+        #prior of each node's play, only filled in for PUCT
+        self.priors = np.zeros(capacity, dtype=np.float64)
+        self.num_nodes = 1
+        self.root = 0
+        self.max_nodes = max_nodes
+        #the number of simulations already under the root at the start of each search, i.e. inherited from earlier turns
+        self.inherited_sims = []
+
+    #makes sure there is room for at least num_new more nodes, doubling the arrays as needed
+    def reserve(self, num_new):
+        capacity = len(self.num_sims)
+        if self.num_nodes + num_new <= capacity:
+            return
+        while capacity < self.num_nodes + num_new:
+            capacity *= 2
+        self.num_sims = np.resize(self.num_sims, capacity)
+        self.num_wins = np.resize(self.num_wins, capacity)
+        self.parent = np.resize(self.parent, capacity)
+        self.first_child = np.resize(self.first_child, capacity)
+        self.num_children = np.resize(self.num_children, capacity)
+        self.plays = np.resize(self.plays, (capacity, 5))
+        self.priors = np.resize(self.priors, capacity)
+
+    #allocates one child per play for the node whose state is game
+    #a player without any plays gets a single pass play
+    def expand(self, node, game):
+        turn = game.turn
+        if game.is_player_finished(turn):
+            possible_plays = []
+        else:
+            possible_plays = [(turn,)+tuple(play) for play in game.possible_plays()]
+        if not possible_plays:
+            possible_plays = [(turn, -1, -1, -1, -1)]
+        self.reserve(len(possible_plays))
+        start = self.num_nodes
+        end = start + len(possible_plays)
+        self.num_sims[start:end] = 0
+        self.num_wins[start:end] = 0
+        self.parent[start:end] = node
+        self.first_child[start:end] = -1
+        self.num_children[start:end] = 0
+        self.plays[start:end] = possible_plays
+        if self.selection_method == 'puct':
+            self.priors[start:end] = play_priors(possible_plays, game.pieces)
+        self.first_child[node] = start
+        self.num_children[node] = len(possible_plays)
+        self.num_nodes = end
+
+    #picks a child of node
+    #with UCB1 that's an unvisited one at random if there are any, otherwise the best score
+    #with PUCT it's always the best score, since unvisited children are scored by their priors
+    def select_child(self, node):
+        start = self.first_child[node]
+        end = start + self.num_children[node]
+        sims = self.num_sims[start:end]
+        wins = self.num_wins[start:end]
+        if self.selection_method == 'puct':
+            return start + int(np.argmax(puct_scores(wins, sims, self.priors[start:end], self.num_sims[node], self.explore_param)))
+        if self.selection_method != 'ucb1':
+            if VERBOSE:
+                print('ERROR: Unrecognized MCTS selection method')
+            return None
+        unvisited = np.flatnonzero(sims == 0)
+        if len(unvisited) > 0:
+            return start + unvisited[random.randint(0, len(unvisited)-1)]
+        return start + int(np.argmax(ucb1_scores(wins, sims, self.num_sims[node], self.explore_param)))
+
+    #applies the play leading into node to game (in place)
+    def apply_play(self, node, game):
+        play = self.plays[node]
+        if play[1] == -1:
+            game.pass_turn(retire=True)
+        else:
+            game.execute_play(int(play[0]), int(play[1]), int(play[2]), int(play[3]), int(play[4]))
+
+    #walks back up from node to the root through the parent indices
+    def backprop(self, node, winners):
+        while node != -1:
+            self.num_sims[node] += 1
+            if self.plays[node][0] in winners:
+                self.num_wins[node] += 1
+            if node == self.root:
+                break
+            node = self.parent[node]
+
+    #perform MCTS to expand the current tree for max_time seconds (self.max_time if None)
+    def expand_tree(self, max_time=None):
+        if max_time is None:
+            max_time = self.max_time
+        if self.rollout_heuristic is not None and VERBOSE:
+            print('ERROR: Unrecognized rollout heuristic')
+        self.inherited_sims.append(int(self.num_sims[self.root]))
+        start_time = time.time()
+        finished = False
+        while not finished:
+            game = self.root_game.copy()
+            node = self.root
+            while self.num_children[node] > 0 and not game.is_finished():
+                node = self.select_child(node)
+                self.apply_play(node, game)
+            if not game.is_finished():
+                self.expand(node, game)
+                node = self.select_child(node)
+                self.apply_play(node, game)
+            self.backprop(node, random_playout(game))
+            if self.max_nodes is not None and self.num_nodes > self.max_nodes:
+                self.prune_tree()
+
+            if time.time()-start_time >= max_time:
+                finished = True
+
+    #there are never any worker processes to shut down (see MCTSTree.close_pool)
+    def close_pool(self):
+        pass
+
+    #returns a dict mapping each of the root's plays to its (num_sims, num_wins)
+    def root_stats(self):
+        start = self.first_child[self.root]
+        return {tuple(int(x) for x in self.plays[i]): (int(self.num_sims[i]), int(self.num_wins[i]))
+                for i in range(start, start+self.num_children[self.root])}
+
+    #return the best play currently available
+    def get_best_play(self):
+        if self.num_children[self.root] == 0:
+            return (-1,-1,-1,-1)
+        start = self.first_child[self.root]
+        sims = self.num_sims[start:start+self.num_children[self.root]]
+        wins = self.num_wins[start:start+self.num_children[self.root]]
+        if VERBOSE:
+            print(str(int(np.sum(sims == 0))) + '/' + str(len(sims)))
+        scores = np.where(sims > 0, wins/np.maximum(sims, 1), -1.0)
+        return tuple(int(x) for x in self.plays[start+int(np.argmax(scores))][1:])
+
+    #moves the root down to the child for play, copying that subtree to the front of the arrays
+    #takes a tuple, play, of the form (player_id, piece_id, piece_or, row, col)
+    def rebase_tree(self, play):
+        new_root = None
+        start = self.first_child[self.root]
+        for i in range(start, start+self.num_children[self.root]):
+            if tuple(int(x) for x in self.plays[i]) == tuple(play):
+                new_root = i
+        if play[1] == -1:
+            self.root_game.pass_turn(retire=True)
+        else:
+            self.root_game.execute_play(play[0], play[1], play[2], play[3], play[4])
+
+        if new_root is None:
+            self.num_nodes = 1
+            self.num_sims[0] = 0
+            self.num_wins[0] = 0
+            self.parent[0] = -1
+            self.first_child[0] = -1
+            self.num_children[0] = 0
+            self.plays[0] = play
+        else:
+            self.compact(new_root)
+        self.root = 0
+
+    #keeps only the subtree under node, renumbered breadth first so that it starts at index 0
+    def compact(self, node):
+        order = [node]
+        i = 0
+        while i < len(order):
+            curr = order[i]
+            if self.num_children[curr] > 0:
+                start = self.first_child[curr]
+                order.extend(range(start, start+self.num_children[curr]))
+            i += 1
+        order = np.array(order, dtype=np.int64)
+        new_index = -np.ones(self.num_nodes, dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+
+        self.num_sims = self.num_sims[order]
+        self.num_wins = self.num_wins[order]
+        self.plays = self.plays[order]
+        self.priors = self.priors[order]
+        self.num_children = self.num_children[order]
+        self.parent = np.where(self.parent[order] >= 0, new_index[self.parent[order]], -1).astype(np.int32)
+        self.parent[0] = -1
+        first_child = self.first_child[order]
+        self.first_child = np.where(first_child >= 0, new_index[first_child], -1).astype(np.int32)
+        self.num_nodes = len(order)
+
+    #the number of nodes in the subtree under every node, counting the node itself
+    #children are always stored after their parents, so one backwards pass adds every subtree up
+    def subtree_sizes(self):
+        sizes = np.ones(self.num_nodes, dtype=np.int64)
+        parent = self.parent
+        for node in range(self.num_nodes-1, 0, -1):
+            if parent[node] >= 0:
+                sizes[parent[node]] += sizes[node]
+        return sizes
+
+    #evicts subtrees, fewest simulations first, until the tree is down to MCTS_PRUNE_FRACTION of max_nodes
+    #an evicted subtree's top node keeps its statistics and loses its children, which are made again if it's selected
+    def prune_tree(self):
+        target = int(self.max_nodes*MCTS_PRUNE_FRACTION)
+        while self.num_nodes > target:
+            sizes = self.subtree_sizes()
+            num_freed = 0
+            for node in np.argsort(self.num_sims[:self.num_nodes], kind='stable'):
+                if num_freed >= self.num_nodes-target:
+                    break
+                if node == self.root or self.num_children[node] == 0:
+                    continue
+                num_freed += sizes[node]-1
+                self.num_children[node] = 0
+                self.first_child[node] = -1
+            if num_freed == 0:
+                break
+            self.compact(self.root)
@@ -1,4 +1,8 @@
+import os
+import pickle
+import hashlib
 import numpy as np
+from constants import *
 
 #keeps all of the masks associated with one of the 21 pieces
 #the top left corner is (0,0) for all masks, even if there is a gap in the piece there
@@ -55,7 +59,14 @@ class Piece:
                 padded_area = np.pad(area,padding_shapes[j],'constant')
                 selected = np.logical_and(padded_area,diag)
                 row,col = np.where(selected)
-                self.diag_locs[i][j] = [(row[k]+reverse_shift[j][0],col[k]+reverse_shift[j][1]) for k in range(len(row))]
+                self.diag_locs[i][j] = [(int(row[k])+reverse_shift[j][0],int(col[k])+reverse_shift[j][1]) for k in range(len(row))]
+
+        #pack each orientation into integer bitmasks laid out like a padded board (see bitboard.py)
+        #area bits are shifted by (row+1, col+1) to place a piece, adj and diag bits by (row, col)
+        self.area_bits = [mask_to_bits(mask) for mask in self.area_masks]
+        self.area_cells = [[(int(i), int(j)) for i, j in zip(*np.where(mask))] for mask in self.area_masks]
+        self.adj_bits = [mask_to_bits(mask) for mask in self.adj_masks]
+        self.diag_bits = [mask_to_bits(mask) for mask in self.diag_masks]
 
     #make a deep copy
     #Note: This is expensive, and there's really no reason to use it unless you're really worried
@@ -67,10 +78,52 @@ class Piece:
         print(str((player_id+1)*(np.array(self.area_masks[piece_or], dtype=np.uint8))) + '\n')
 
 
+#packs a 2D bool mask into an int, with cell (i,j) stored at bit i*(BOARD_WIDTH+2)+j
+def mask_to_bits(mask):
+    bits = 0
+    rows, cols = np.where(mask)
+    for k in range(len(rows)):
+        bits |= 1 << (int(rows[k])*(BOARD_WIDTH+2) + int(cols[k]))
+    return bits
+
+
+#pieces lists that have already been read, keyed by (file name, hash of its contents)
+read_pieces_lists = {}
+
 #reads all of the different piece shapes from a file
-#only call this ONCE, even if many games are played
-#it's pretty expensive
+#building the Pieces is pretty expensive, so the result is kept in memory (repeated calls get the same list back)
+#and pickled to file_name + PIECES_CACHE_SUFFIX, which is used as long as the file and PIECES_CACHE_VERSION haven't changed
 def read_pieces(file_name):
+    with open(file_name, 'rb') as read_file:
+        file_hash = hashlib.sha256(read_file.read()).hexdigest()
+    key = (os.path.abspath(file_name), file_hash)
+    if key not in read_pieces_lists:
+        cache_file = file_name + PIECES_CACHE_SUFFIX
+        pieces = None
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as read_file:
+                    cached = pickle.load(read_file)
+                if cached['version'] == PIECES_CACHE_VERSION and cached['hash'] == file_hash:
+                    pieces = cached['pieces']
+            except Exception:
+                pieces = None
+        if pieces is None:
+            pieces = build_pieces(file_name)
+            try:
+                #written under a temporary name first, so that other processes never see half a file
+                temp_file = cache_file + '.' + str(os.getpid())
+                with open(temp_file, 'wb') as write_file:
+                    pickle.dump({'version': PIECES_CACHE_VERSION, 'hash': file_hash, 'pieces': pieces}, write_file)
+                os.replace(temp_file, cache_file)
+            except OSError:
+                if VERBOSE:
+                    print('ERROR: Could not write the piece cache ' + cache_file)
+        read_pieces_lists[key] = pieces
+    return read_pieces_lists[key]
+
+#builds the Pieces for read_pieces from the shapes in a file
+def build_pieces(file_name):
     read_file = open(file_name, 'r')
     areas = []
     pieces = []
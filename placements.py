@@ -0,0 +1,122 @@
+import numpy as np
+from constants import *
+
+
+#lists the flat indices of set bits in a bitmask, padded out to length with the index of a dummy cell
+def bits_to_cells(bits, length, dummy):
+    cells = []
+    while bits:
+        low_bit = bits & -bits
+        cells.append(low_bit.bit_length()-1)
+        bits ^= low_bit
+    return cells + [dummy]*(length-len(cells))
+
+#keeps every in-bounds placement of every piece orientation, indexed by the corners it can be built from
+#placement k is the play plays[k] = (piece_id, piece_or, row, col), with footprint masks already shifted into place
+#using the same bit layout as BitBoard (cell (r,c) of the padded board is bit r*(BOARD_WIDTH+2)+c)
+#corner_plays[row][col][corner_type][piece_id] lists the placements that fit against that corner
+#(row, col are padded board coordinates and corner_type follows Board.corners)
+#for vectorized checks, area_cells/adj_cells/diag_cells hold each footprint as flat indices into the padded board,
+#padded with NUM_CELLS, which should point at an extra cell that is always empty
+#lookup[piece_id][piece_or][row][col] is the placement index of any play, or -1 if it's out of bounds
+class PlacementTable:
+    def __init__(self, pieces):
+        stride = BOARD_WIDTH + 2
+        self.pieces = pieces
+        self.plays = []
+        self.area_bits = []
+        self.adj_bits = []
+        self.diag_bits = []
+        self.index = {}
+        self.corner_plays = [[[[[] for _ in range(len(pieces))] for _ in range(4)] for _ in range(BOARD_WIDTH+2)] for _ in range(BOARD_HEIGHT+2)]
+
+        for piece in pieces:
+            #every distinct shape gets placements, so that lookup can find any play
+            #only piece.unique_ors are indexed by corner, so that play generation matches Board.legal_play loops
+            shape_ors = [por for por in range(8) if not [i for i in range(por) if np.array_equal(piece.area_masks[i], piece.area_masks[por])]]
+            for por in sorted(set(piece.unique_ors + shape_ors)):
+                area_shape = piece.area_masks[por].shape
+                for row in range(BOARD_HEIGHT-area_shape[0]+1):
+                    for col in range(BOARD_WIDTH-area_shape[1]+1):
+                        self.index[(piece.id, por, row, col)] = len(self.plays)
+                        self.plays.append((piece.id, por, row, col))
+                        self.area_bits.append(piece.area_bits[por] << ((row+1)*stride + col+1))
+                        self.adj_bits.append(piece.adj_bits[por] << (row*stride + col))
+                        self.diag_bits.append(piece.diag_bits[por] << (row*stride + col))
+
+            for por in piece.unique_ors:
+                area_shape = piece.area_masks[por].shape
+                #a corner (r,c) of type i takes the piece's corners of type (i+2)%4
+                for i in range(4):
+                    for posn in piece.diag_locs[por][(i+2) % 4]:
+                        for row in range(BOARD_HEIGHT-area_shape[0]+1):
+                            for col in range(BOARD_WIDTH-area_shape[1]+1):
+                                ids = self.corner_plays[row+posn[0]+1][col+posn[1]+1][i][piece.id]
+                                ids.append(self.index[(piece.id, por, row, col)])
+
+        self.num_cells = (BOARD_HEIGHT+2)*stride
+        self.area_cells = self.cell_array(self.area_bits)
+        self.adj_cells = self.cell_array(self.adj_bits)
+        self.diag_cells = self.cell_array(self.diag_bits)
+
+        #corner_plays flattened for vectorized lookups: the placements for corner slot s = corner_type*num_cells + flat cell
+        #are corner_indices[corner_starts[s]:corner_starts[s]+corner_counts[s]], and placement_pids gives each one's piece
+        self.placement_pids = np.array([play[0] for play in self.plays], dtype=np.int64)
+        self.corner_counts = np.zeros(4*self.num_cells, dtype=np.int64)
+        corner_indices = []
+        for i in range(4):
+            for row in range(BOARD_HEIGHT+2):
+                for col in range(BOARD_WIDTH+2):
+                    slot_plays = [index for pid_plays in self.corner_plays[row][col][i] for index in pid_plays]
+                    self.corner_counts[i*self.num_cells + row*stride + col] = len(slot_plays)
+                    corner_indices.extend(slot_plays)
+        self.corner_indices = np.array(corner_indices, dtype=np.int64)
+        self.corner_starts = np.cumsum(self.corner_counts) - self.corner_counts
+
+        #repeated orientations share the placements of the first orientation with the same shape
+        self.lookup = -np.ones((len(pieces), 8, BOARD_HEIGHT, BOARD_WIDTH), dtype=np.int64)
+        for piece in pieces:
+            for piece_or in range(8):
+                por = [i for i in range(8) if np.array_equal(piece.area_masks[i], piece.area_masks[piece_or])][0]
+                area_shape = piece.area_masks[por].shape
+                for row in range(BOARD_HEIGHT-area_shape[0]+1):
+                    for col in range(BOARD_WIDTH-area_shape[1]+1):
+                        self.lookup[piece.id][piece_or][row][col] = self.index[(piece.id, por, row, col)]
+
+    #stacks a list of footprint bitmasks into an array of flat cell indices (see bits_to_cells)
+    def cell_array(self, masks):
+        length = max([bin(bits).count('1') for bits in masks])
+        return np.array([bits_to_cells(bits, length, self.num_cells) for bits in masks], dtype=np.int64)
+
+    #returns the placement index of each row of an Nx4 array of plays, or -1 for plays that are out of bounds
+    def lookup_plays(self, plays):
+        plays = np.asarray(plays, dtype=np.int64).reshape((-1, 4))
+        in_range = (plays[:,0] >= 0) & (plays[:,0] < len(self.pieces)) & (plays[:,1] >= 0) & (plays[:,1] < 8) \
+                   & (plays[:,2] >= 0) & (plays[:,2] < BOARD_HEIGHT) & (plays[:,3] >= 0) & (plays[:,3] < BOARD_WIDTH)
+        ids = -np.ones(len(plays), dtype=np.int64)
+        valid = plays[in_range]
+        ids[in_range] = self.lookup[valid[:,0], valid[:,1], valid[:,2], valid[:,3]]
+        return ids
+
+
+#placement tables that have already been built, keyed by the id of the pieces list
+#the pieces list is kept alongside so that its id can't be reused
+#this is only a shortcut in front of placement_tables_by_shape, so it's emptied whenever it gets big
+placement_tables = {}
+MAX_PIECE_LISTS = 64
+
+#the same tables keyed by the pieces' shapes, so that copies of a pieces list (e.g. unpickled in a worker) share them
+placement_tables_by_shape = {}
+
+#returns the PlacementTable for a list of Pieces, building it the first time it's asked for
+#like read_pieces, this is only expensive once per process
+def get_placement_table(pieces):
+    key = id(pieces)
+    if key not in placement_tables:
+        shape_key = tuple([(piece.id, piece.area_bits[0]) for piece in pieces])
+        if shape_key not in placement_tables_by_shape:
+            placement_tables_by_shape[shape_key] = PlacementTable(pieces)
+        if len(placement_tables) >= MAX_PIECE_LISTS:
+            placement_tables.clear()
+        placement_tables[key] = (pieces, placement_tables_by_shape[shape_key])
+    return placement_tables[key][1]
@@ -28,6 +28,10 @@ class Player:
     def receive_play(self, game, last_play):
         pass
 
+    #called by play_game once the game is over, to release anything the player holds on to (e.g. worker processes)
+    def close(self):
+        pass
+
     #this method should be overridden by autonomous agents
     #it is currently set up to take keyboard input from a human user
     #the entire game is passed as a parameter
@@ -1,109 +1,143 @@
 import numpy as np
 from constants import *
+from game import Game
+from game_state import game_state
+from transposition import TranspositionTable
+from zobrist import ZOBRIST_SEARCHER
 
+#one state on the current search path
+#plays lists the plays still to search below it (a pass is (player_id, -1, -1, -1, -1)) and next_play is where we're up to
+#score accumulates (wins, losses) from the children searched so far
+#undo is the record that takes the search's game back to the parent's state,
+#and retired is True if the player to move was marked as finished here because they had no plays
 class SearchNode:
-    def __init__(self, game, last_play, parent):
-        self.game = game.copy()
+    def __init__(self, last_play, parent, undo=None):
         self.last_play = last_play
         self.parent = parent
-        self.children = []
+        self.undo = undo
+        self.plays = []
+        self.next_play = 0
         self.score = None
+        self.store = False
+        self.retired = False
+        self.depth = 0 if parent is None else parent.depth+1
 
 
+#the search makes and unmakes plays on one GameState copy of the game, self.game
 class SearchTree:
-    def __init__(self, game):
-        self.root = SearchNode(game, None, None)
+    def __init__(self, game, table=None):
+        self.game = game_state(game)
+        self.root = SearchNode(None, None)
         self.num_nodes = 1
+        self.table = table
+
+    #the key of the current state in the table: its state_key, plus who the (wins, losses) counts are for
+    def table_key(self, orig_player):
+        return self.game.state_key() ^ ZOBRIST_SEARCHER[orig_player]
+
+    #looks the current state up in the table, or else works out which plays need to be searched below node
+    #the root is never looked up, since its plays have to be searched to score each of them
+    #afterwards, node.plays is empty if node.score is already final
+    def open_node(self, node, orig_player):
+        game = self.game
+        if node.parent is not None:
+            stored = self.table.lookup(self.table_key(orig_player))
+            if stored is not None: #state has already been looked at
+                node.score = stored
+                return
+        node.score = [0,0]
+        if game.is_player_finished(game.turn): #current player has quit
+            self.num_nodes += 1
+            node.plays = [(game.turn, -1, -1, -1, -1)]
+            return
+        node.store = True
+        possible_plays = game.possible_plays()
+        if possible_plays:
+            self.num_nodes += len(possible_plays)
+            node.plays = possible_plays
+            return
+        #current player has just run out of plays
+        game.set_finished(game.turn, True)
+        node.retired = True
+        if game.is_finished(): #the game is over
+            scores = game.get_scores()
+            if scores[orig_player] == min(scores):
+                node.score = [1,0]
+            else:
+                node.score = [0,1]
+        else:
+            self.num_nodes += 1
+            node.plays = [(game.turn, -1, -1, -1, -1)]
 
     #exhaustively search all possible moves, expanding up to max_nodes
     #returns (None, None) if max_nodes exceeded
     #otherwise, returns a tuple containing a list of all possible plays and a corresponding list of (wins,losses)
     #resulting from those plays
+    #the search is depth first without recursion: only the nodes on the current path are kept, plays are undone on the way back up,
+    #and results for positions are shared through a TranspositionTable, keyed on Game.state_key() and the player to move at the root
+    #the tree's table is used if it has one (so it can be reused between searches), otherwise a new one is made
+    #every call starts again from a fresh root, so it can be called again (e.g. with a bigger max_nodes) after failing
     def exhaustive_search(self, max_nodes=None):
-        results = {}
-        orig_player = self.root.game.turn
+        if self.table is None:
+            self.table = TranspositionTable()
+        orig_player = self.game.turn
+        self.root = SearchNode(None, None)
+        self.num_nodes = 1
         too_many_nodes = False
+        possible_plays = []
+        play_values = []
 
-        #a helper for the helper
-        #expands a node for a finished player
-        def expand_pass(curr_node):
-            self.num_nodes += 1
-            curr_node.score = [0,0]
-            new_game = curr_node.game.copy()
-            new_game.pass_turn()
-            new_child = SearchNode(new_game, (curr_node.game.turn, -1, -1, -1, -1), curr_node)
-            curr_node.children.append(new_child)
-            expand_child(new_child)
-            if new_child.score is not None:
-                curr_node.score[0] += new_child.score[0]
-                curr_node.score[1] += new_child.score[1]
-
-        #recursive helper function
-        def expand_child(curr_node):
-            nonlocal too_many_nodes
-            if max_nodes is None or self.num_nodes<=max_nodes: #not too many nodes
-                if curr_node.game not in results: #state hasn't already been looked at
-                    if curr_node.game.players[curr_node.game.turn].finished: #current player has quit
-                        expand_pass(curr_node)
-                    else:
-                        possible_plays = curr_node.game.possible_plays()
-                        if not possible_plays: #current player has just run out of plays
-                            curr_node.game.players[curr_node.game.turn].finished = True
-                            finished = True
-                            for player in curr_node.game.players:
-                                finished = finished and player.finished
-                            if finished: #all players are out of plays; the game is over
-                                win = False
-                                if curr_node.game.players[orig_player].score == min([player.score for player in curr_node.game.players]):
-                                    win = True
-                                if win:
-                                    results[curr_node.game] = [1,0]
-                                    curr_node.score = [1,0]
-                                else:
-                                    results[curr_node.game] = [0,1]
-                                    curr_node.score = [0,1]
-                            else:
-                                expand_pass(curr_node)
-                        else:
-                            self.num_nodes += len(possible_plays)
-                            curr_node.score = [0,0]
-                            for play in possible_plays:
-                                new_game = curr_node.game.copy()
-                                new_game.execute_play(new_game.turn, play[0], play[1], play[2], play[3])
-                                new_child = SearchNode(new_game, play, curr_node)
-                                curr_node.children.append(new_child)
-                                expand_child(new_child)
-                                if new_child.score is not None:
-                                    curr_node.score[0] += new_child.score[0]
-                                    curr_node.score[1] += new_child.score[1]
-                                # if curr_node.parent == None:
-                                #     print(play)
-                                #     print(new_child.score)
-                        results[curr_node.game] = curr_node.score
+        self.open_node(self.root, orig_player)
+        path = [self.root]
+        while path:
+            curr_node = path[-1]
+            if curr_node.next_play < len(curr_node.plays): #search the next child
+                if max_nodes is not None and self.num_nodes > max_nodes:
+                    too_many_nodes = True
+                    break
+                play = curr_node.plays[curr_node.next_play]
+                curr_node.next_play += 1
+                if play[1] == -1:
+                    undo = self.game.pass_turn()
                 else:
-                    curr_node.score = results[curr_node.game]
-            else:
-                too_many_nodes = True
+                    undo = self.game.execute_play(self.game.turn, play[0], play[1], play[2], play[3])
+                new_child = SearchNode(play, curr_node, undo)
+                self.open_node(new_child, orig_player)
+                path.append(new_child)
+            else: #all of this node's children are done
+                path.pop()
+                if curr_node.store:
+                    self.table.store(self.table_key(orig_player), curr_node.score, curr_node.depth)
+                if curr_node.retired:
+                    self.game.set_finished(self.game.turn, False)
+                if curr_node.parent is not None:
+                    self.game.undo_play(curr_node.undo)
+                    curr_node.parent.score[0] += curr_node.score[0]
+                    curr_node.parent.score[1] += curr_node.score[1]
+                    if curr_node.parent is self.root:
+                        possible_plays.append(curr_node.last_play)
+                        play_values.append(curr_node.score)
 
-        expand_child(self.root)
         if too_many_nodes:
+            #take the game back to the root for whoever searches next
+            while path:
+                curr_node = path.pop()
+                if curr_node.retired:
+                    self.game.set_finished(self.game.turn, False)
+                if curr_node.parent is not None:
+                    self.game.undo_play(curr_node.undo)
             if VERBOSE:
                 print('Exhaustive search failed to finish with less than ' + str(max_nodes) + ' nodes')
             possible_plays = None
             play_values = None
-        else:
-            possible_plays = [child.last_play for child in self.root.children]
-            play_values = [child.score for child in self.root.children]
+        if VERBOSE:
+            print(self.table.stats_string())
         return possible_plays, play_values
 
 
-if __name__ == '__main__':
-    pass
-    from piece import read_pieces
-    from random_bot import RandomBot
-    from game import Game
-    pieces = read_pieces(PIECES_FILE)
-    players = [RandomBot(i) for i in range(NUM_PLAYERS)]
+#a late-game position (player 1 to move) that is small enough to search exhaustively
+#players are the Players to put in the Game; their pieces and scores are overwritten
+def test_endgame(pieces, players):
     test_board = [[255,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,255],
                   [0,4,0,4,4,0,0,0,4,0,4,4,0,0,0,0,0,0,0,0,8,0],
                   [0,4,4,0,4,0,0,0,4,0,4,4,0,0,8,0,0,0,8,8,8,0],
@@ -132,6 +166,15 @@ if __name__ == '__main__':
                    [True,False,False,False,True,False,False,True,True,False,False,True,True,False,False,False,True,False,True,True,False]]
     turn = 0
     test_board = np.array(test_board, dtype=np.uint8)
-    test_game = Game(pieces, players,test_board,pieces_left,turn)
+    return Game(pieces, players, test_board, pieces_left, turn)
+
+
+if __name__ == '__main__':
+    pass
+    from piece import read_pieces
+    from random_bot import RandomBot
+    pieces = read_pieces(PIECES_FILE)
+    players = [RandomBot(i) for i in range(NUM_PLAYERS)]
+    test_game = test_endgame(pieces, players)
     tree = SearchTree(test_game)
     print(tree.exhaustive_search(100000))
\ No newline at end of file
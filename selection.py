@@ -0,0 +1,30 @@
+import numpy as np
+import math
+from constants import *
+
+#child selection rules for the MCTS trees, vectorized over all of a node's children at once
+#each takes arrays of the children's wins and visits (with any virtual losses already added to the visits)
+#and the parent's visit count, and returns an array of scores; the child with the highest score is picked
+
+#UCB1: win rate + explore_param*sqrt(ln(parent_sims)/sims)
+#unvisited children score infinity, so they're always tried first
+def ucb1_scores(wins, sims, parent_sims, explore_param):
+    visited_sims = np.maximum(sims, 1)
+    scores = wins/visited_sims + explore_param*np.sqrt(math.log(max(parent_sims, 1))/visited_sims)
+    return np.where(sims > 0, scores, np.inf)
+
+#PUCT: win rate + explore_param*prior*sqrt(parent_sims)/(1+sims)
+#unvisited children count as a win rate of 0, so they're tried in order of their priors rather than all at once
+def puct_scores(wins, sims, priors, parent_sims, explore_param):
+    win_rates = np.where(sims > 0, wins/np.maximum(sims, 1), 0.0)
+    return win_rates + explore_param*priors*math.sqrt(parent_sims)/(1.0+sims)
+
+#the PUCT score a child with the given prior would have before it's visited
+def unvisited_puct_score(prior, parent_sims, explore_param):
+    return explore_param*prior*math.sqrt(parent_sims)
+
+#prior probabilities for a list of plays (player_id, piece_id, piece_or, row, col), in proportion to the value of
+#the piece played, so that bigger pieces are tried first; a pass counts as a 1 square piece
+def play_priors(plays, pieces):
+    weights = np.array([pieces[play[1]].value if play[1] != -1 else 1 for play in plays], dtype=np.float64)
+    return weights/np.sum(weights)
@@ -1,29 +1,119 @@
 import time
+import random
+import multiprocessing
 import numpy as np
 from constants import *
 from game import play_game
+from game_archive import GameRecorder, GameArchiveWriter
+from game_state import GameState
+from batch_playout import BatchPlayout
 from util import *
 
-#calculate and print out some basic stats for a large number of games
-def calc_stats(pieces, orig_players):
+#plays one game for calc_stats and returns its stats as a dict
+#args is a tuple (pieces, players, seed, record); the players are copied so the originals are never touched
+#if record is True, the game's packed plays are returned too, under 'plies' (see game_archive.GameRecorder)
+#play_game and RandomBot count into the global stats dict, so it's swapped for a fresh one while the game runs,
+#and put back afterwards in case the game is run in the caller's process
+def play_stats_game(args):
     global stats
-    for i in range(NUM_STATS_GAMES):
-        stats['num_plays'].append(0)
-        stats['num_branch'].append([])
+    pieces, orig_players, seed, record = args
+    random.seed(seed)
+    np.random.seed(seed % (2**32))
+    saved_stats = dict(stats)
+    stats.clear()
+    stats.update(new_stats())
+    stats['num_plays'].append(0)
+    stats['num_branch'].append([])
+
+    players = [player.copy() for player in orig_players]
+    game_start_time = time.time()
+    recorder = GameRecorder() if record else None
+    winners = play_game(pieces, players, recorder)
+    game_end_time = time.time()
+
+    game_stats = {}
+    game_stats['winners'] = [winner-1 for winner in winners]
+    game_stats['game_time'] = game_end_time - game_start_time
+    game_stats['num_plays'] = stats['num_plays'][-1]
+    game_stats['num_branch'] = stats['num_branch'][-1]
+    stats.clear()
+    stats.update(saved_stats)
+    if record:
+        game_stats['plies'] = recorder.last_game
+    return game_stats
+
+#adds the stats of one game from play_stats_game to a dict made by new_stats
+def merge_game_stats(all_stats, game_stats):
+    all_stats['num_games'] += 1
+    for winner in game_stats['winners']:
+        all_stats['num_wins'][winner] += 1
+    all_stats['game_time'].append(game_stats['game_time'])
+    all_stats['num_plays'].append(game_stats['num_plays'])
+    all_stats['num_branch'].append(game_stats['num_branch'])
+    all_stats['avg_branch'].append(np.mean(game_stats['num_branch']))
+    all_stats['max_branch'].append(np.max(game_stats['num_branch']))
+    all_stats['max_branch_turn'].append(np.argmax(game_stats['num_branch']))
+
+#calculate and print out some basic stats for a large number of games
+#games are spread over num_workers processes (all cores if None, or run in this process if 1)
+#every game gets its own copy of the players and its own RNG seed, counting up from seed
+#if record_path is given, every game's plays are appended to the game archive there in seed order (imap hands results back in job order)
+def calc_stats(pieces, orig_players, num_games=NUM_STATS_GAMES, num_workers=NUM_STATS_WORKERS, seed=None, record_path=None):
+    if seed is None:
+        seed = int(time.time())
+    all_stats = new_stats()
+    jobs = [(pieces, orig_players, seed+i, record_path is not None) for i in range(num_games)]
+    writer = GameArchiveWriter(record_path) if record_path is not None else None
+
+    if num_workers == 1:
+        results = map(play_stats_game, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap(play_stats_game, jobs)
+    for i, game_stats in enumerate(results):
+        merge_game_stats(all_stats, game_stats)
+        if writer is not None:
+            writer.add_encoded_game(*game_stats['plies'])
+        if ((i+1)*10)%num_games == 0:
+            print(str(int(100*(i+1.0)/num_games)) + '%')
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if writer is not None:
+        writer.close()
 
-        players = [player.copy() for player in orig_players]#[player_type(i) for i in range(NUM_PLAYERS)]
-        game_start_time = time.time()
-        play_game(pieces, players)
-        game_end_time = time.time()
+    print_stats(all_stats)
+    return all_stats
 
-        stats['game_time'].append(game_end_time - game_start_time)
-        stats['avg_branch'].append(np.mean(stats['num_branch'][-1]))
-        stats['max_branch'].append(np.max(stats['num_branch'][-1]))
-        stats['max_branch_turn'].append(np.argmax(stats['num_branch'][-1]))
+#calc_stats for 4 random players, playing the games batch_size at a time in lockstep with a BatchPlayout
+#like RandomBot using one_possible_play, every turn counts with a branching factor of 1
+#the time per game is the time for the whole batch spread evenly over its games
+def calc_random_stats(pieces, num_games=NUM_STATS_GAMES, batch_size=PLAYOUT_BATCH, seed=None):
+    if seed is None:
+        seed = int(time.time())
+    np.random.seed(seed % (2**32))
+    all_stats = new_stats()
+    for start in range(0, num_games, batch_size):
+        num_batch = min(batch_size, num_games-start)
+        batch_start_time = time.time()
+        batch = BatchPlayout([GameState(pieces)]*num_batch)
+        winners = batch.run()
+        game_time = (time.time()-batch_start_time)/num_batch
+        for k in range(num_batch):
+            game_stats = {}
+            game_stats['winners'] = winners[k]
+            game_stats['game_time'] = game_time
+            game_stats['num_plays'] = int(batch.num_plays[k])
+            game_stats['num_branch'] = [1]*int(batch.num_plays[k])
+            merge_game_stats(all_stats, game_stats)
+        print(str(int(100*(start+num_batch)/num_games)) + '%')
 
-        if ((i+1)*10)%NUM_STATS_GAMES == 0:
-            print(str(int(100*(i+1.0)/NUM_STATS_GAMES)) + '%')
+    print_stats(all_stats)
+    return all_stats
 
+#print out the stats gathered by calc_stats
+def print_stats(stats):
     print()
     print('Games played: ' + str(stats['num_games']))
     print_str = 'Win %:'
@@ -35,4 +125,4 @@ def calc_stats(pieces, orig_players):
     print('Avg. branching factor: ' + print_num(np.mean(stats['avg_branch'])) + ' +\\- ' + print_num(np.std(stats['avg_branch'])))
     print('Max branching factor: ' + print_num(np.mean(stats['max_branch'])) + ' +\\- ' + print_num(np.std(stats['max_branch'])))
     print('Max branching turn: ' + print_num(np.mean(stats['max_branch_turn'])) + ' +\\- ' + print_num(np.std(stats['max_branch_turn'])) \
-          + ' (round ' + str(int(np.floor(np.mean(stats['max_branch_turn'])/NUM_PLAYERS))) + ')')
\ No newline at end of file
+          + ' (round ' + str(int(np.floor(np.mean(stats['max_branch_turn'])/NUM_PLAYERS))) + ')')
@@ -0,0 +1,90 @@
+import numpy as np
+from constants import *
+from game import Game, make_board
+from player import Player
+
+#a fixed-size binary encoding of a game state, for storing positions and sending them between processes
+#the layout (STATE_BYTES bytes in all) is:
+#   1 byte                   - turn in bits 0-1, and player i's finished flag in bit 2+i
+#   3 bytes per player       - piece mask, little endian, with bit p set while piece p is still left
+#   BOARD_BYTES bytes        - the board: BOARD_CELLS/8 bytes of occupancy bits (np.packbits order, row major),
+#                              then 2 bits per cell for the owner of occupied cells, 4 cells to a byte starting at the low bits
+#2 bits per cell can't tell an empty cell from 4 owners, so the occupancy plane takes the extra bit per cell
+#equal states always have equal encodings, so the bytes can also be used as exact dict or table keys
+
+BOARD_CELLS = BOARD_HEIGHT*BOARD_WIDTH
+OCCUPANCY_BYTES = (BOARD_CELLS+7) // 8
+OWNER_BYTES = (BOARD_CELLS+3) // 4
+BOARD_BYTES = OCCUPANCY_BYTES + OWNER_BYTES
+PIECE_MASK_BYTES = 3
+STATE_BYTES = 1 + NUM_PLAYERS*PIECE_MASK_BYTES + BOARD_BYTES
+
+#OWNER_OF_BITS[bits] is the player whose bit is set in a board cell value (0 for empty cells)
+OWNER_OF_BITS = np.zeros(256, dtype=np.uint8)
+for i in range(NUM_PLAYERS):
+    OWNER_OF_BITS[1 << i] = i
+
+#2-bit owner codes for the 4 cells in one byte
+OWNER_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+#packs the cells of a Board (or BitBoard) into BOARD_BYTES bytes
+def encode_board(board):
+    cells = board.board[1:-1,1:-1].reshape(-1)
+    occupancy = np.packbits(cells != 0)
+    owners = np.zeros(OWNER_BYTES*4, dtype=np.uint8)
+    owners[:BOARD_CELLS] = OWNER_OF_BITS[cells]
+    owners = np.bitwise_or.reduce(owners.reshape((-1, 4)) << OWNER_SHIFTS, axis=1).astype(np.uint8)
+    return occupancy.tobytes() + owners.tobytes()
+
+#unpacks BOARD_BYTES bytes from encode_board into a padded uint8 board array
+def decode_board_array(data):
+    data = np.frombuffer(data, dtype=np.uint8, count=BOARD_BYTES)
+    occupied = np.unpackbits(data[:OCCUPANCY_BYTES])[:BOARD_CELLS].astype(bool)
+    owners = ((data[OCCUPANCY_BYTES:, None] >> OWNER_SHIFTS) & 3).reshape(-1)[:BOARD_CELLS]
+    board = np.zeros((BOARD_HEIGHT+2, BOARD_WIDTH+2), dtype=np.uint8)
+    board[1:-1,1:-1] = np.where(occupied, np.left_shift(1, owners), 0).reshape((BOARD_HEIGHT, BOARD_WIDTH))
+    board[0][0] = CORNER_SENTINEL
+    board[0][BOARD_WIDTH+1] = CORNER_SENTINEL
+    board[BOARD_HEIGHT+1][0] = CORNER_SENTINEL
+    board[BOARD_HEIGHT+1][BOARD_WIDTH+1] = CORNER_SENTINEL
+    return board
+
+#unpacks BOARD_BYTES bytes from encode_board into a board of the type BOARD_ENGINE picks
+def decode_board(data):
+    return make_board(decode_board_array(data))
+
+#packs a Game into STATE_BYTES bytes
+def encode_game(game):
+    header = game.turn
+    for i in range(NUM_PLAYERS):
+        if game.players[i].finished:
+            header |= 1 << (2+i)
+    data = bytes([header])
+    for player in game.players:
+        mask = 0
+        for p_id in np.flatnonzero(player.pieces):
+            mask |= 1 << int(p_id)
+        data += mask.to_bytes(PIECE_MASK_BYTES, 'little')
+    return data + encode_board(game.board)
+
+#unpacks STATE_BYTES bytes from encode_game into a Game using pieces
+#players are the Players to put in the Game (plain Players if None); their pieces, scores and finished flags are overwritten
+def decode_game(data, pieces, players=None):
+    if len(data) != STATE_BYTES:
+        if VERBOSE:
+            print('ERROR: encoded game state has the wrong length')
+        return None
+    if players is None:
+        players = [Player(i) for i in range(NUM_PLAYERS)]
+    header = data[0]
+    player_pieces = []
+    for i in range(NUM_PLAYERS):
+        start = 1 + i*PIECE_MASK_BYTES
+        mask = int.from_bytes(data[start:start+PIECE_MASK_BYTES], 'little')
+        player_pieces.append(np.array([(mask >> p_id) & 1 for p_id in range(NUM_PIECES)], dtype=bool))
+    board = decode_board_array(data[1+NUM_PLAYERS*PIECE_MASK_BYTES:])
+    game = Game(pieces, players, board, player_pieces, header & 3)
+    for i in range(NUM_PLAYERS):
+        players[i].finished = bool(header & (1 << (2+i)))
+    return game
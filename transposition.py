@@ -0,0 +1,59 @@
+import numpy as np
+from constants import *
+
+#a transposition table with a fixed size, keyed on 64-bit state keys (e.g. Game.state_key())
+#entries live in preallocated arrays, so its memory use is fixed when it's made (about 34 bytes per slot)
+#each key can only go in slot key % num_slots; when two keys want the same slot, policy decides who keeps it:
+#   'depth'  - depth-preferred: the entry closer to the root (smaller depth, so more work saved) stays
+#   'always' - the newest entry always replaces the old one
+#values are pairs of ints, such as the (wins, losses) counts of SearchTree.exhaustive_search
+class TranspositionTable:
+    def __init__(self, num_slots=TT_SLOTS, policy='depth'):
+        self.num_slots = num_slots
+        self.policy = policy
+        if VERBOSE and policy not in ('depth', 'always'):
+            print('ERROR: Unrecognized transposition table replacement policy')
+        self.keys = np.zeros(num_slots, dtype=np.uint64)
+        self.values = np.zeros((num_slots, 2), dtype=np.int64)
+        self.depths = np.zeros(num_slots, dtype=np.int16)
+        self.used = np.zeros(num_slots, dtype=bool)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+        self.rejections = 0
+
+    #returns the stored value for key as a list [a, b], or None if it isn't in the table
+    def lookup(self, key):
+        slot = key % self.num_slots
+        if self.used[slot] and int(self.keys[slot]) == key:
+            self.hits += 1
+            return self.values[slot].tolist()
+        self.misses += 1
+        return None
+
+    #stores a value for key, found depth plies below the root
+    def store(self, key, value, depth=0):
+        slot = key % self.num_slots
+        if self.used[slot] and int(self.keys[slot]) != key:
+            if self.policy == 'depth' and depth > self.depths[slot]:
+                self.rejections += 1
+                return
+            self.replacements += 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+        self.used[slot] = True
+        self.stores += 1
+
+    #the number of slots holding an entry
+    def num_entries(self):
+        return int(np.count_nonzero(self.used))
+
+    #a one line summary of how the table has been used
+    def stats_string(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0*self.hits/lookups if lookups > 0 else 0.0
+        return 'TT: ' + str(self.hits) + ' hits, ' + str(self.misses) + ' misses (' + str(round(hit_rate, 1)) + '%), ' \
+               + str(self.num_entries()) + '/' + str(self.num_slots) + ' slots used, ' + str(self.replacements) + ' replaced, ' \
+               + str(self.rejections) + ' not stored'
@@ -1,13 +1,12 @@
 import os
-import json
-import numpy as np
 
-from colorama import Fore, Back, Style, init
-from game import Board
-from game import idtobits
+from constants import *
+from piece import read_pieces
+from game_archive import GameArchive, import_json_games
 
 '''
-Looks for files in "game_data/"
+Reads games from the archive at GAME_ARCHIVE_FILE
+(while it has no games, the JSON game records in "game_data/" are imported into it)
 enter a game number to select a game
 enter a turn number to select a turn 
 or hit enter to jump to the next turn
@@ -15,16 +14,17 @@ or hit enter to jump to the next turn
 '''
 
 
-all_data = []
-for root, dirs, files in os.walk("game_data"):   
-    for file in files:
-        if file.endswith(".txt"):
-            d = json.load(open(root + "/" + file, "r"))
-            all_data.append(d)
+pieces = read_pieces(PIECES_FILE)
+archive = GameArchive(GAME_ARCHIVE_FILE) if os.path.exists(GAME_ARCHIVE_FILE) else None
+if archive is None or archive.num_games() == 0:
+    if archive is not None:
+        archive.close()
+    print("imported " + str(import_json_games("game_data", GAME_ARCHIVE_FILE, pieces)) + " games")
+    archive = GameArchive(GAME_ARCHIVE_FILE)
            
 #list of games from individual perspectives
 
-print("ready")
+print("ready (" + str(archive.num_games()) + " games)")
 
 game_num = 0
 while(True):
@@ -36,7 +36,6 @@ while(True):
 	else:
 		game_num = int(game_input)
 	turn_num = 0
-	game = all_data[game_num]
 	while(True):
 		turn_input = input("turn: ")
 		if(turn_input == "n" or turn_input == ""):
@@ -45,16 +44,11 @@ while(True):
 			break
 		else:
 			turn_num = int(turn_input)
-		states = game["states"]
-		turn = states[turn_num]
-		not_board = Board()
+		game = archive.game_at(game_num, turn_num, pieces)
 
-		not_board.board[1:-1, 1:-1] = idtobits(np.array(turn["board"]))
-
-		not_board.print_board()
-		print(turn["player_turn"]-1)
-		print(turn["pieces_left"])
+		game.board.print_board()
+		print(game.turn)
+		print([player.pieces.tolist() for player in game.players])
 	
 #interesting games:
 #599
-
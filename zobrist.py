@@ -0,0 +1,43 @@
+import random
+import numpy as np
+from constants import *
+
+#random 64-bit keys for Zobrist hashing of game states
+#the generator is seeded so that every process (and every run) agrees on the keys
+zobrist_random = random.Random(ZOBRIST_SEED)
+
+#ZOBRIST_CELLS[player_id][row][col] is xored in while that player covers the cell (padded board coordinates)
+ZOBRIST_CELLS = [[[zobrist_random.getrandbits(64) for _ in range(BOARD_WIDTH+2)] for _ in range(BOARD_HEIGHT+2)] for _ in range(NUM_PLAYERS)]
+
+#ZOBRIST_PIECES[player_id][piece_id] is xored in once the player has used the piece
+ZOBRIST_PIECES = [[zobrist_random.getrandbits(64) for _ in range(NUM_PIECES)] for _ in range(NUM_PLAYERS)]
+
+#ZOBRIST_FINISHED[player_id] is xored in while the player is finished
+ZOBRIST_FINISHED = [zobrist_random.getrandbits(64) for _ in range(NUM_PLAYERS)]
+
+#ZOBRIST_TURN[player_id] is xored in while it's that player's turn
+ZOBRIST_TURN = [zobrist_random.getrandbits(64) for _ in range(NUM_PLAYERS)]
+
+#ZOBRIST_SEARCHER[player_id] is xored into transposition table keys for searches scored from that player's point of view
+#(see SearchTree.table_key), so that one table can be shared between searches for different players
+ZOBRIST_SEARCHER = [zobrist_random.getrandbits(64) for _ in range(NUM_PLAYERS)]
+
+
+#computes the key of a padded uint8 board array from scratch
+def board_key(board):
+    key = 0
+    for player_id in range(NUM_PLAYERS):
+        cells = ZOBRIST_CELLS[player_id]
+        rows, cols = np.nonzero(board[1:BOARD_HEIGHT+1,1:BOARD_WIDTH+1] & (1 << player_id))
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            key ^= cells[row+1][col+1]
+    return key
+
+
+#returns what to xor into a board's key when player_id puts piece_or of piece at (row, col)
+def play_key(player_id, piece, piece_or, row, col):
+    key = 0
+    cells = ZOBRIST_CELLS[player_id]
+    for i, j in piece.area_cells[piece_or]:
+        key ^= cells[row+1+i][col+1+j]
+    return key